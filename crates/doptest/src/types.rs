@@ -94,6 +94,10 @@ pub struct StareConfig {
 pub struct StareOptionsConfig {
     #[serde(skip_serializing_if = "Option::is_none")]
     pub noise_mask_method: Option<String>,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub dtype: Option<String>,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub compare: Option<Vec<String>>,
 }
 
 #[derive(Debug, Clone, Serialize, Deserialize)]
@@ -115,6 +119,10 @@ pub struct WindConfig {
 pub struct WindOptionsConfig {
     #[serde(skip_serializing_if = "Option::is_none")]
     pub azimuth_offset_deg: Option<f64>,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub dtype: Option<String>,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub compare: Option<Vec<String>>,
 }
 
 #[derive(Debug, Clone, Serialize, Deserialize)]
@@ -134,9 +142,19 @@ pub struct TurbulenceConfig {
     pub instrument_id: String,
     pub instrument_uuid: String,
     #[serde(skip_serializing_if = "Option::is_none")]
+    pub options: Option<TurbulenceOptionsConfig>,
+    #[serde(skip_serializing_if = "Option::is_none")]
     pub description: Option<String>,
 }
 
+#[derive(Debug, Clone, Serialize, Deserialize)]
+pub struct TurbulenceOptionsConfig {
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub dtype: Option<String>,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub compare: Option<Vec<String>>,
+}
+
 #[derive(Debug, Clone, Serialize, Deserialize)]
 pub struct RawConfig {
     pub id: String,
@@ -197,6 +215,8 @@ pub enum TestEntry {
         date: String,
         instrument_id: String,
         instrument_uuid: String,
+        #[serde(skip_serializing_if = "Option::is_none")]
+        options: Option<TurbulenceOptionsConfig>,
     },
     #[serde(rename = "raw")]
     Raw {
@@ -342,6 +362,7 @@ impl TestsConfig {
                 date: e.date.clone(),
                 instrument_id: e.instrument_id.clone(),
                 instrument_uuid: e.instrument_uuid.clone(),
+                options: e.options.clone(),
             });
         }
         for e in &self.raw {
@@ -1,6 +1,38 @@
-from doppy import netcdf, options, product, raw
+from __future__ import annotations
+
+import importlib
+from types import ModuleType
+from typing import TYPE_CHECKING
+
 from doppy.rs import __version__
 
-from . import bench
+if TYPE_CHECKING:
+    from doppy import bench, netcdf, options, product, raw
+
+# Submodules are imported on first attribute access so that e.g. `doppy.raw`
+# does not pay for netCDF4, scipy and scikit-learn used by the products.
+_LAZY_SUBMODULES = frozenset(
+    (
+        "bench",
+        "defaults",
+        "exceptions",
+        "netcdf",
+        "options",
+        "product",
+        "raw",
+        "utils",
+    )
+)
+
+
+def __getattr__(name: str) -> ModuleType:
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | _LAZY_SUBMODULES)
+
 
 __all__ = ["raw", "options", "product", "netcdf", "bench", "__version__"]
@@ -1,24 +1,139 @@
 from __future__ import annotations
 
-import pathlib
+import os
 import warnings
+from dataclasses import dataclass
 from types import TracebackType
-from typing import Literal, TypeAlias
+from typing import Any, BinaryIO, Callable, Literal, TypeAlias
 
-import netCDF4
 import numpy as np
 import numpy.typing as npt
 
 NetCDFDataType: TypeAlias = Literal["f4", "f8", "i4", "i8", "u4", "u8"]
+Compression: TypeAlias = Literal[
+    "zlib",
+    "szip",
+    "zstd",
+    "bzip2",
+    "blosc_lz",
+    "blosc_lz4",
+    "blosc_lz4hc",
+    "blosc_zlib",
+    "blosc_zstd",
+]
+QuantizeMode: TypeAlias = Literal["BitGroom", "BitRound", "GranularBitRound"]
+
+_INITIAL_MEMORY = 2**20
+
+
+@dataclass(frozen=True)
+class WriterOptions:
+    """
+    Storage options of the variables written by Dataset. The defaults give
+    the same files as before these options existed.
+
+    Parameters
+    ----------
+    compression
+        compression codec, or None for no compression. Codecs other than
+        zlib and szip need the HDF5 filter plugins of the netCDF library.
+    complevel
+        compression level, 0-9
+    shuffle
+        apply the HDF5 shuffle filter before compression
+    chunk_time
+        number of time steps per chunk of variables whose first dimension
+        is time. The other dimensions are not split. None uses the default
+        chunking of the netCDF library.
+    significant_digits
+        number of significant digits kept in floating point variables with
+        at least two dimensions, e.g. (time, range), or None to keep all.
+        The data are quantized with quantize_mode so that they compress
+        better. One dimensional variables such as range or height are never
+        quantized.
+    quantize_mode
+        quantization algorithm used with significant_digits
+    """
+
+    compression: Compression | None = "zlib"
+    complevel: int = 4
+    shuffle: bool = True
+    chunk_time: int | None = None
+    significant_digits: int | None = None
+    quantize_mode: QuantizeMode = "BitGroom"
+
+    def __post_init__(self) -> None:
+        if not 0 <= self.complevel <= 9:
+            raise ValueError("complevel must be between 0 and 9")
+        if self.chunk_time is not None and self.chunk_time < 1:
+            raise ValueError("chunk_time must be positive")
+        if self.significant_digits is not None and self.significant_digits < 1:
+            raise ValueError("significant_digits must be positive")
+
+
+def write_to_file(
+    write: Callable[[Dataset], None],
+    filename: str | os.PathLike[str] | BinaryIO,
+    format: Literal["NETCDF4", "NETCDF4_CLASSIC"] = "NETCDF4",
+    options: WriterOptions | None = None,
+) -> None:
+    """
+    Calls write with a Dataset of filename. If filename is not a path but a
+    writable binary file object, the file is encoded in memory and written
+    to it.
+    """
+    if isinstance(filename, (str, os.PathLike)):
+        with Dataset(filename, format=format, options=options) as nc:
+            write(nc)
+        return
+    data = memoryview(write_to_bytes(write, format=format, options=options))
+    while len(data) > 0:
+        # Raw streams may write only part of the data, objects that return
+        # None are assumed to write everything
+        nwritten = filename.write(data)
+        data = data[nwritten if nwritten is not None else len(data) :]
+
+
+def write_to_bytes(
+    write: Callable[[Dataset], None],
+    format: Literal["NETCDF4", "NETCDF4_CLASSIC"] = "NETCDF4",
+    options: WriterOptions | None = None,
+) -> bytes:
+    """
+    Calls write with an in-memory Dataset and returns the encoded file
+    """
+    with Dataset(None, format=format, options=options) as nc:
+        write(nc)
+    if nc.data is None:
+        raise RuntimeError("In-memory netCDF file was not returned on close")
+    return nc.data
 
 
 class Dataset:
+    """
+    Writes a netCDF file to filename, or to memory if filename is None. The
+    in-memory file is available as bytes in `data` after the dataset is
+    closed.
+    """
+
     def __init__(
         self,
-        filename: str | pathlib.Path,
+        filename: str | os.PathLike[str] | None,
         format: Literal["NETCDF4", "NETCDF4_CLASSIC"] = "NETCDF4",
+        options: WriterOptions | None = None,
     ) -> None:
-        self.nc = netCDF4.Dataset(filename, mode="w", format=format)
+        import netCDF4
+
+        self.options = options if options is not None else WriterOptions()
+        self.data: bytes | None = None
+        if filename is None:
+            # memory is the initial size of the in-memory file, which grows
+            # as needed
+            self.nc = netCDF4.Dataset(
+                "inmemory.nc", mode="w", format=format, memory=_INITIAL_MEMORY
+            )
+        else:
+            self.nc = netCDF4.Dataset(filename, mode="w", format=format)
 
     def __enter__(self) -> Dataset:
         return self
@@ -53,7 +168,9 @@ class Dataset:
         long_name: str | None = None,
     ) -> Dataset:
         time, units, calendar = _convert_time(data)
-        var = self.nc.createVariable(name, dtype, dimensions, compression="zlib")
+        var = self.nc.createVariable(
+            name, dtype, dimensions, **self._storage(dimensions, time.shape)
+        )
         var.units = units
         var.calendar = calendar
         var.axis = "T"
@@ -75,9 +192,19 @@ class Dataset:
         long_name: str | None = None,
         mask: npt.NDArray[np.bool_] | None = None,
     ) -> Dataset:
+        import netCDF4
+
         fill_value = netCDF4.default_fillvals[dtype] if mask is not None else None
+        storage = self._storage(dimensions, np.shape(data))
+        if (
+            self.options.significant_digits is not None
+            and dtype in ("f4", "f8")
+            and len(dimensions) >= 2
+        ):
+            storage["significant_digits"] = self.options.significant_digits
+            storage["quantize_mode"] = self.options.quantize_mode
         var = self.nc.createVariable(
-            name, dtype, dimensions, fill_value=fill_value, compression="zlib"
+            name, dtype, dimensions, fill_value=fill_value, **storage
         )
         var.units = units
         if mask is not None:
@@ -109,7 +236,30 @@ class Dataset:
         return self
 
     def close(self) -> None:
-        self.nc.close()
+        memory = self.nc.close()
+        if isinstance(memory, memoryview):
+            self.data = memory.tobytes()
+
+    def _storage(
+        self, dimensions: tuple[str, ...], shape: tuple[int, ...]
+    ) -> dict[str, Any]:
+        """
+        Keyword arguments of createVariable for compression and chunking
+        """
+        storage: dict[str, Any] = {"compression": self.options.compression}
+        if self.options.compression is not None:
+            storage["complevel"] = self.options.complevel
+            storage["shuffle"] = self.options.shuffle
+        if (
+            self.options.chunk_time is not None
+            and len(dimensions) > 0
+            and dimensions[0] == "time"
+        ):
+            storage["chunksizes"] = (
+                max(1, min(self.options.chunk_time, shape[0])),
+                *(max(1, n) for n in shape[1:]),
+            )
+        return storage
 
 
 def _convert_time(
@@ -16,3 +16,9 @@ class BgFitMethod(Enum):
 class NoiseMaskMethod(Enum):
     INTENSITY_AND_VELOCITY = "intensity_and_velocity"
     INTENSITY_ONLY = "intensity_only"
+
+
+class Executor(Enum):
+    SERIAL = "serial"
+    THREAD = "thread"
+    PROCESS = "process"
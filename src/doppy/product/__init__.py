@@ -1,6 +1,53 @@
-from doppy.product.stare import Stare
-from doppy.product.stare_depol import StareDepol
-from doppy.product.wind import Options as WindOptions
-from doppy.product.wind import Wind
+from __future__ import annotations
 
-__all__ = ["Stare", "StareDepol", "Wind", "WindOptions"]
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from doppy.product.stare import Stare
+    from doppy.product.stare_builder import StareBuilder
+    from doppy.product.stare_depol import StareDepol
+    from doppy.product.stare_pipeline import StarePipeline
+    from doppy.product.wind import Options as WindOptions
+    from doppy.product.wind import Wind
+    from doppy.product.wind_builder import WindBuilder
+
+_LAZY_ATTRIBUTES = {
+    "Stare": ("doppy.product.stare", "Stare"),
+    "StareBuilder": ("doppy.product.stare_builder", "StareBuilder"),
+    "StareDepol": ("doppy.product.stare_depol", "StareDepol"),
+    "StarePipeline": ("doppy.product.stare_pipeline", "StarePipeline"),
+    "Wind": ("doppy.product.wind", "Wind"),
+    "WindBuilder": ("doppy.product.wind_builder", "WindBuilder"),
+    "WindOptions": ("doppy.product.wind", "Options"),
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_ATTRIBUTES:
+        module_name, attribute = _LAZY_ATTRIBUTES[name]
+        value = getattr(importlib.import_module(module_name), attribute)
+        globals()[name] = value
+        return value
+    # Submodules, such as `stare`, are imported on first access as well
+    try:
+        return importlib.import_module(f"{__name__}.{name}")
+    except ModuleNotFoundError as err:
+        if err.name != f"{__name__}.{name}":
+            raise
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
+
+__all__ = [
+    "Stare",
+    "StareBuilder",
+    "StareDepol",
+    "StarePipeline",
+    "Wind",
+    "WindBuilder",
+    "WindOptions",
+]
@@ -1,9 +1,7 @@
 import warnings
 
-import bottleneck as bn
 import numpy as np
 import numpy.typing as npt
-import scipy
 
 
 def detect_wind_noise(
@@ -77,17 +75,60 @@ def _rolling_median_over_range(
     """
     window
         range window in meters
+
+    Gates that share the same window offsets, which is every gate away from
+    the edges when the range resolution is uniform, are computed together
+    with a single moving median along the range axis.
     """
-    X = arr.T.copy()
-    X[mask.T] = np.nan
+    import bottleneck as bn
+    import scipy.interpolate
 
-    half_window = window / 2
+    X = np.where(mask, np.nan, arr)
+    start, stop = _range_window_bounds(range_, window)
+    n = len(range_)
 
+    med = np.full(X.shape, np.nan, dtype=X.dtype)
+    offset_change = np.flatnonzero((np.diff(start) != 1) | (np.diff(stop) != 1))
+    run_bounds = np.concatenate(([0], offset_change + 1, [n]))
+    for k0, k1 in zip(run_bounds[:-1], run_bounds[1:]):
+        size = stop[k0] - start[k0] + 1
+        block = X[:, start[k0] : stop[k1 - 1] + 1]
+        if k1 - k0 == 1:
+            med[:, k0] = bn.nanmedian(block, axis=1)
+        else:
+            med[:, k0:k1] = bn.move_median(block, size, min_count=1, axis=1)[
+                :, size - 1 :
+            ]
+
+    if stride != 1:
+        ind = list(range(0, n, stride))
+        if fill_gaps:
+            f_interp = scipy.interpolate.interp1d(
+                range_[ind], med[:, ind], axis=1, fill_value="extrapolate"
+            )
+            return np.array(f_interp(range_), dtype=np.float64)
+        strided = med[:, ind]
+        med[:] = np.nan
+        med[:, ind] = strided
+    return med
+
+
+def _range_window_bounds(
+    range_: npt.NDArray[np.float64], window: float
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """
+    Returns
+    -------
+    start, stop
+        inclusive gate index bounds of the rolling window for each gate
+    """
+    half_window = window / 2
+    n = len(range_)
+    start = np.zeros(n, dtype=np.int64)
+    stop = np.zeros(n, dtype=np.int64)
     i = 0
     j = 0
-    n = len(range_)
-    med = np.full(X.shape, np.nan, dtype=np.float64)
-    for k in range(0, n, stride):
+    for k in range(n):
         r = range_[k]
         while i + 1 < n and r - range_[i + 1] >= half_window:
             i += 1
@@ -95,13 +136,6 @@ def _rolling_median_over_range(
             j += 1
         if i > k or j < k:
             raise ValueError
-        med[k] = bn.nanmedian(X[i : j + 1], axis=0)
-
-    if stride != 1 and fill_gaps:
-        ind = list(range(0, n, stride))
-        f_interp = scipy.interpolate.interp1d(
-            range_[ind], med[ind], axis=0, fill_value="extrapolate"
-        )
-        med_all = f_interp(range_)
-        return np.array(med_all.T.copy(), dtype=np.float64)
-    return np.array(med.T.copy(), dtype=np.float64)
+        start[k] = i
+        stop[k] = j
+    return start, stop
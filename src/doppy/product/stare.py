@@ -1,20 +1,24 @@
 from __future__ import annotations
 
+import hashlib
+import os
+import threading
 from collections import defaultdict
+from concurrent.futures import Future
 from dataclasses import dataclass
 from io import BufferedIOBase
 from pathlib import Path
-from typing import DefaultDict, Sequence, Tuple, TypeAlias
+from typing import Any, BinaryIO, Callable, DefaultDict, Sequence, Tuple, TypeAlias
 
 import numpy as np
 import numpy.typing as npt
-import scipy
-from scipy.ndimage import median_filter, uniform_filter
-from sklearn.cluster import KMeans
 
 import doppy
 from doppy import defaults, options
+from doppy.product import tiling
 from doppy.product.noise_utils import detect_wind_noise
+from doppy.product.utils import compute_dtype
+from doppy.raw.halo_bg import _src_filename, _time_from_filename
 
 SelectionGroupKeyType: TypeAlias = tuple[int,]
 
@@ -80,15 +84,44 @@ class Stare:
         | Sequence[Path]
         | Sequence[bytes]
         | Sequence[BufferedIOBase],
+        workers: int = 1,
+        dtype: npt.DTypeLike = np.float64,
     ) -> Stare:
-        raws = doppy.raw.WindCubeFixed.from_srcs(data)
+        """
+        Parameters
+        ----------
+        workers
+            number of threads used for the noise filters
+        dtype
+            floating point type, np.float32 or np.float64, of the product
+            fields and of the computations after parsing
+        """
+        return cls.from_windcube_raw(
+            doppy.raw.WindCubeFixed.from_srcs(data), workers, dtype
+        )
+
+    @classmethod
+    def from_windcube_raw(
+        cls,
+        raws: Sequence[doppy.raw.WindCubeFixed],
+        workers: int = 1,
+        dtype: npt.DTypeLike = np.float64,
+    ) -> Stare:
+        """
+        Same as from_windcube_data but for parsed files
+        """
+        dtype = compute_dtype(dtype)
         raw = (
-            doppy.raw.WindCubeFixed.merge(raws).sorted_by_time().nan_profiles_removed()
+            doppy.raw.WindCubeFixed.merge(list(raws))
+            .sorted_by_time()
+            .nan_profiles_removed()
         )
+        cnr = raw.cnr.astype(dtype, copy=False)
+        radial_velocity = raw.radial_velocity.astype(dtype, copy=False)
 
         wavelength = defaults.WindCube.wavelength
         beta = _compute_beta(
-            snr=raw.cnr,
+            snr=cnr,
             radial_distance=raw.radial_distance,
             wavelength=wavelength,
             beam_energy=defaults.WindCube.beam_energy,
@@ -97,9 +130,9 @@ class Stare:
             effective_diameter=defaults.WindCube.effective_diameter,
         )
 
-        mask_beta = _compute_noise_mask_for_windcube(raw)
+        mask_beta = _compute_noise_mask_for_windcube(cnr, radial_velocity, workers)
         mask_radial_velocity = detect_wind_noise(
-            raw.radial_velocity, raw.radial_distance, mask_beta
+            radial_velocity, raw.radial_distance, mask_beta
         )
 
         return cls(
@@ -107,8 +140,8 @@ class Stare:
             radial_distance=raw.radial_distance,
             elevation=raw.elevation,
             beta=beta,
-            snr=raw.cnr,
-            radial_velocity=raw.radial_velocity,
+            snr=cnr,
+            radial_velocity=radial_velocity,
             mask_beta=mask_beta,
             mask_radial_velocity=mask_radial_velocity,
             wavelength=wavelength,
@@ -133,41 +166,130 @@ class Stare:
         noise_mask_method: options.NoiseMaskMethod = (
             options.NoiseMaskMethod.INTENSITY_AND_VELOCITY
         ),
+        block_profiles: int | None = None,
+        workers: int = 1,
+        dtype: npt.DTypeLike = np.float64,
     ) -> Stare:
-        raws = doppy.raw.HaloHpl.from_srcs(data)
-
-        if len(raws) == 0:
-            raise doppy.exceptions.NoDataError("HaloHpl data missing")
-
-        raw = (
-            doppy.raw.HaloHpl.merge(_select_raws_for_stare(raws))
-            .sorted_by_time()
-            .non_strictly_increasing_timesteps_removed()
-            .nans_removed()
+        """
+        Parameters
+        ----------
+        block_profiles
+            If given, the profiles are processed in blocks of this many profiles
+            to limit the size of temporary arrays. The result is identical to
+            processing all profiles at once, except that the noise mask can
+            differ where its moving mean over time is within rounding of its
+            threshold.
+        workers
+            number of threads used for the noise filters
+        dtype
+            floating point type, np.float32 or np.float64, of the product
+            fields and of the computations after the noise bias correction.
+            The background and noise bias corrections subtract nearly equal
+            intensities and are always computed in float64.
+        """
+        return cls._from_halo_raws(
+            doppy.raw.HaloHpl.from_srcs(data),
+            _relevant_background_parser(data_bg),
+            bg_correction_method=bg_correction_method,
+            noise_mask_method=noise_mask_method,
+            block_profiles=block_profiles,
+            workers=workers,
+            dtype=dtype,
         )
 
-        bgs = doppy.raw.HaloBg.from_srcs(data_bg)
-        bgs = [bg[:, : raw.header.ngates] for bg in bgs]
-        bgs_stare = [bg for bg in bgs if bg.ngates == raw.header.ngates]
+    @classmethod
+    def from_halo_raw(
+        cls,
+        raws: Sequence[doppy.raw.HaloHpl],
+        bgs: Sequence[doppy.raw.HaloBg],
+        bg_correction_method: options.BgCorrectionMethod = (
+            options.BgCorrectionMethod.FIT
+        ),
+        noise_mask_method: options.NoiseMaskMethod = (
+            options.NoiseMaskMethod.INTENSITY_AND_VELOCITY
+        ),
+        block_profiles: int | None = None,
+        workers: int = 1,
+        dtype: npt.DTypeLike = np.float64,
+    ) -> Stare:
+        """
+        Same as from_halo_data but for parsed HPL and background files
+        """
+        return cls._from_halo_raws(
+            raws,
+            lambda time, ngates: bgs,
+            bg_correction_method=bg_correction_method,
+            noise_mask_method=noise_mask_method,
+            block_profiles=block_profiles,
+            workers=workers,
+            dtype=dtype,
+        )
 
-        if len(bgs_stare) == 0:
-            raise doppy.exceptions.NoDataError("Background data missing")
+    @classmethod
+    def _from_halo_raws(
+        cls,
+        raws: Sequence[doppy.raw.HaloHpl],
+        get_backgrounds: Callable[
+            [npt.NDArray[np.datetime64], int], Sequence[doppy.raw.HaloBg]
+        ],
+        bg_correction_method: options.BgCorrectionMethod,
+        noise_mask_method: options.NoiseMaskMethod,
+        block_profiles: int | None = None,
+        workers: int = 1,
+        bg_fit_cache: _BackgroundFitCache | None = None,
+        dtype: npt.DTypeLike = np.float64,
+    ) -> Stare:
+        """
+        Parameters
+        ----------
+        get_backgrounds
+            returns the background files for the given profile times and
+            number of gates
+        """
+        dtype = compute_dtype(dtype)
+        if len(raws) == 0:
+            raise doppy.exceptions.NoDataError("HaloHpl data missing")
 
-        bg = (
-            doppy.raw.HaloBg.merge(bgs_stare)
-            .sorted_by_time()
-            .non_strictly_increasing_timesteps_removed()
+        raw = _merge_raws_for_stare(_select_raws_for_stare(raws))
+        del raws
+        bgs = get_backgrounds(raw.time, raw.header.ngates)
+        bg = _merge_backgrounds_for_stare(bgs, raw.header.ngates)
+        if block_profiles is not None:
+            return _halo_stare_in_blocks(
+                raw,
+                bg,
+                bg_correction_method,
+                noise_mask_method,
+                block_profiles,
+                workers,
+                bg_fit_cache,
+                dtype,
+            )
+        raw, intensity_bg_corrected = _correct_background(
+            raw, bg, bg_correction_method, bg_fit_cache
         )
-        raw, intensity_bg_corrected = _correct_background(raw, bg, bg_correction_method)
         if len(raw.time) == 0:
             raise doppy.exceptions.NoDataError("No matching data and bg files")
         intensity_noise_bias_corrected = _correct_intensity_noise_bias(
-            raw, intensity_bg_corrected
+            raw, intensity_bg_corrected, workers
+        )
+        del intensity_bg_corrected
+        radial_velocity = raw.radial_velocity.astype(dtype, copy=False)
+        mask_beta = _compute_noise_mask(
+            intensity_noise_bias_corrected,
+            radial_velocity,
+            raw.radial_distance,
+            noise_mask_method,
+            workers,
         )
+        # intensity is not needed anymore, so reuse it for snr
+        intensity_noise_bias_corrected -= 1
+        snr = intensity_noise_bias_corrected.astype(dtype, copy=False)
+        del intensity_noise_bias_corrected
         wavelength = defaults.Halo.wavelength
 
         beta = _compute_beta(
-            snr=intensity_noise_bias_corrected - 1,
+            snr=snr,
             radial_distance=raw.radial_distance,
             wavelength=wavelength,
             beam_energy=defaults.Halo.beam_energy,
@@ -176,16 +298,10 @@ class Stare:
             effective_diameter=defaults.Halo.effective_diameter,
         )
 
-        mask_beta = _compute_noise_mask(
-            intensity_noise_bias_corrected,
-            raw.radial_velocity,
-            raw.radial_distance,
-            noise_mask_method,
-        )
         match noise_mask_method:
             case options.NoiseMaskMethod.INTENSITY_AND_VELOCITY:
                 mask_radial_velocity = detect_wind_noise(
-                    raw.radial_velocity, raw.radial_distance, mask_beta
+                    radial_velocity, raw.radial_distance, mask_beta
                 )
             case options.NoiseMaskMethod.INTENSITY_ONLY:
                 mask_radial_velocity = mask_beta.copy()
@@ -195,8 +311,8 @@ class Stare:
             radial_distance=raw.radial_distance,
             elevation=raw.elevation,
             beta=beta,
-            snr=intensity_noise_bias_corrected - 1,
-            radial_velocity=raw.radial_velocity,
+            snr=snr,
+            radial_velocity=radial_velocity,
             mask_beta=mask_beta,
             mask_radial_velocity=mask_radial_velocity,
             wavelength=wavelength,
@@ -204,97 +320,123 @@ class Stare:
             ray_info=PulsesPerRay(raw.header.pulses_per_ray),
         )
 
-    def write_to_netcdf(self, filename: str | Path) -> None:
-        with doppy.netcdf.Dataset(filename) as nc:
-            nc.add_dimension("time")
-            nc.add_dimension("range")
-            nc.add_time(
-                name="time",
-                dimensions=("time",),
-                standard_name="time",
-                long_name="Time UTC",
-                data=self.time,
-                dtype="f8",
-            )
-            nc.add_variable(
-                name="range",
-                dimensions=("range",),
-                units="m",
-                data=self.radial_distance,
-                dtype="f4",
-            )
-            nc.add_variable(
-                name="elevation",
-                dimensions=("time",),
-                units="degrees",
-                data=self.elevation,
-                dtype="f4",
-                long_name="elevation from horizontal",
-            )
-            nc.add_variable(
-                name="beta_raw",
-                dimensions=("time", "range"),
-                units="sr-1 m-1",
-                data=self.beta,
-                dtype="f4",
-            )
-            nc.add_variable(
-                name="beta",
-                dimensions=("time", "range"),
-                units="sr-1 m-1",
-                data=self.beta,
-                dtype="f4",
-                mask=self.mask_beta,
-            )
-            nc.add_variable(
-                name="v",
-                dimensions=("time", "range"),
-                units="m s-1",
-                long_name="Doppler velocity",
-                data=self.radial_velocity,
-                dtype="f4",
-                mask=self.mask_radial_velocity,
-            )
-            nc.add_scalar_variable(
-                name="wavelength",
-                units="m",
-                standard_name="radiation_wavelength",
-                data=self.wavelength,
-                dtype="f4",
-            )
-            match self.ray_info:
-                case RayAccumulationTime(value):
-                    nc.add_scalar_variable(
-                        name="ray_accumulation_time",
-                        units="s",
-                        long_name="ray accumulation time",
-                        data=value,
-                        dtype="f4",
-                    )
-                case PulsesPerRay(value):
-                    nc.add_scalar_variable(
-                        name="pulses_per_ray",
-                        units="1",
-                        long_name="pulses per ray",
-                        data=value,
-                        dtype="u4",
-                    )
-
-            nc.add_attribute("serial_number", self.system_id)
-            nc.add_attribute("doppy_version", doppy.__version__)
+    def write_to_netcdf(
+        self,
+        filename: str | os.PathLike[str] | BinaryIO,
+        options: doppy.netcdf.WriterOptions | None = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        filename
+            path of the file, or any other object with a write method, e.g.
+            io.BytesIO, to which the encoded file is written as bytes
+        options
+            compression, chunking and quantization of the variables, the
+            defaults are used if None
+        """
+        doppy.netcdf.write_to_file(self._write_netcdf, filename, options=options)
+
+    def write_to_bytes(
+        self, options: doppy.netcdf.WriterOptions | None = None
+    ) -> bytes:
+        """
+        Returns the netCDF file as bytes without writing to disk
+        """
+        return doppy.netcdf.write_to_bytes(self._write_netcdf, options=options)
+
+    def _write_netcdf(self, nc: doppy.netcdf.Dataset) -> None:
+        nc.add_dimension("time")
+        nc.add_dimension("range")
+        nc.add_time(
+            name="time",
+            dimensions=("time",),
+            standard_name="time",
+            long_name="Time UTC",
+            data=self.time,
+            dtype="f8",
+        )
+        nc.add_variable(
+            name="range",
+            dimensions=("range",),
+            units="m",
+            data=self.radial_distance,
+            dtype="f4",
+        )
+        nc.add_variable(
+            name="elevation",
+            dimensions=("time",),
+            units="degrees",
+            data=self.elevation,
+            dtype="f4",
+            long_name="elevation from horizontal",
+        )
+        nc.add_variable(
+            name="beta_raw",
+            dimensions=("time", "range"),
+            units="sr-1 m-1",
+            data=self.beta,
+            dtype="f4",
+        )
+        nc.add_variable(
+            name="beta",
+            dimensions=("time", "range"),
+            units="sr-1 m-1",
+            data=self.beta,
+            dtype="f4",
+            mask=self.mask_beta,
+        )
+        nc.add_variable(
+            name="v",
+            dimensions=("time", "range"),
+            units="m s-1",
+            long_name="Doppler velocity",
+            data=self.radial_velocity,
+            dtype="f4",
+            mask=self.mask_radial_velocity,
+        )
+        nc.add_scalar_variable(
+            name="wavelength",
+            units="m",
+            standard_name="radiation_wavelength",
+            data=self.wavelength,
+            dtype="f4",
+        )
+        match self.ray_info:
+            case RayAccumulationTime(value):
+                nc.add_scalar_variable(
+                    name="ray_accumulation_time",
+                    units="s",
+                    long_name="ray accumulation time",
+                    data=value,
+                    dtype="f4",
+                )
+            case PulsesPerRay(value):
+                nc.add_scalar_variable(
+                    name="pulses_per_ray",
+                    units="1",
+                    long_name="pulses per ray",
+                    data=value,
+                    dtype="u4",
+                )
+
+        nc.add_attribute("serial_number", self.system_id)
+        nc.add_attribute("doppy_version", doppy.__version__)
 
 
 def _compute_noise_mask_for_windcube(
-    raw: doppy.raw.WindCubeFixed,
+    cnr: npt.NDArray[np.float64],
+    radial_velocity: npt.NDArray[np.float64],
+    workers: int = 1,
 ) -> npt.NDArray[np.bool_]:
-    if np.any(np.isnan(raw.cnr)) or np.any(np.isnan(raw.radial_velocity)):
+    if np.any(np.isnan(cnr)) or np.any(np.isnan(radial_velocity)):
         raise ValueError("Unexpected nans in crn or radial_velocity")
 
-    mask = _mask_with_cnr_norm_dist(raw.cnr) | (np.abs(raw.radial_velocity) > 30)
+    mask = _mask_with_cnr_norm_dist(cnr) | (np.abs(radial_velocity) > 30)
 
-    cnr = raw.cnr.copy()
+    cnr = cnr.copy()
     cnr[mask] = np.finfo(float).eps
-    cnr_filt = np.array(median_filter(cnr, size=(3, 3)), dtype=np.float64)
+    cnr_filt = tiling.median_filter(cnr, size=(3, 3), workers=workers)
     rel_diff = np.abs(cnr - cnr_filt) / np.abs(cnr)
     diff_mask = rel_diff > 0.25
 
@@ -304,6 +446,8 @@ def _compute_noise_mask_for_windcube(
 
 
 def _mask_with_cnr_norm_dist(cnr: npt.NDArray[np.float64]) -> npt.NDArray[np.bool_]:
+    import scipy.stats
+
     th_trunc = -5.5
     std_factor = 2
     log_cnr = np.log(cnr)
@@ -319,24 +463,215 @@ def _compute_noise_mask(
     radial_velocity: npt.NDArray[np.float64],
     radial_distance: npt.NDArray[np.float64],
     method: options.NoiseMaskMethod,
+    workers: int = 1,
+) -> npt.NDArray[np.bool_]:
+    intensity_time_mean, velocity_time_mean = _noise_mask_time_means(
+        intensity, radial_velocity, method, workers
+    )
+    return _noise_mask_from_time_means(
+        intensity, intensity_time_mean, velocity_time_mean, radial_distance, workers
+    )
+
+
+_NOISE_MASK_TIME_WINDOW = 21
+_NOISE_MASK_RANGE_WINDOW = 3
+
+
+def _noise_mask_time_means(
+    intensity: npt.NDArray[np.float64],
+    radial_velocity: npt.NDArray[np.float64],
+    method: options.NoiseMaskMethod,
+    workers: int = 1,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64] | None]:
+    """
+    Moving means over time of intensity and, if method uses it, of the
+    absolute radial velocity. Together with the range pass of
+    _noise_mask_from_time_means this is scipy.ndimage.uniform_filter with size
+    (_NOISE_MASK_TIME_WINDOW, _NOISE_MASK_RANGE_WINDOW).
+    """
+    intensity_time_mean = tiling.uniform_filter1d_over_time(
+        intensity, _NOISE_MASK_TIME_WINDOW, workers
+    )
+    match method:
+        case options.NoiseMaskMethod.INTENSITY_AND_VELOCITY:
+            velocity_time_mean = tiling.uniform_filter1d_over_time(
+                np.abs(radial_velocity), _NOISE_MASK_TIME_WINDOW, workers
+            )
+            return intensity_time_mean, velocity_time_mean
+        case options.NoiseMaskMethod.INTENSITY_ONLY:
+            return intensity_time_mean, None
+
+
+def _noise_mask_from_time_means(
+    intensity: npt.NDArray[np.float64],
+    intensity_time_mean: npt.NDArray[np.float64],
+    velocity_time_mean: npt.NDArray[np.float64] | None,
+    radial_distance: npt.NDArray[np.float64],
+    workers: int = 1,
 ) -> npt.NDArray[np.bool_]:
-    intensity_mean_mask = uniform_filter(intensity, size=(21, 3)) < 1.0025
+    """
+    Noise mask of the given profiles from their moving means over time, the
+    velocity term is left out if velocity_time_mean is None
+    """
+    intensity_mean_mask = (
+        tiling.uniform_filter1d_over_range(
+            intensity_time_mean, _NOISE_MASK_RANGE_WINDOW, workers
+        )
+        < 1.0025
+    )
     THREE_PULSES_LENGTH = 90
     near_instrument_noise_mask = np.zeros_like(intensity, dtype=np.bool_)
     near_instrument_noise_mask[:, radial_distance < THREE_PULSES_LENGTH] = True
     low_intensity_mask = intensity < 1
     base = near_instrument_noise_mask | low_intensity_mask
-    match method:
-        case options.NoiseMaskMethod.INTENSITY_AND_VELOCITY:
-            velocity_abs_mean_mask = (
-                uniform_filter(np.abs(radial_velocity), size=(21, 3)) > 2
+    if velocity_time_mean is None:
+        intensity_term = intensity_mean_mask
+    else:
+        velocity_abs_mean_mask = (
+            tiling.uniform_filter1d_over_range(
+                velocity_time_mean, _NOISE_MASK_RANGE_WINDOW, workers
             )
-            intensity_term = intensity_mean_mask & velocity_abs_mean_mask
-        case options.NoiseMaskMethod.INTENSITY_ONLY:
-            intensity_term = intensity_mean_mask
+            > 2
+        )
+        intensity_term = intensity_mean_mask & velocity_abs_mean_mask
     return np.asarray(base | intensity_term, dtype=np.bool_)
 
 
+def _compute_noise_mask_in_blocks(
+    intensity: npt.NDArray[np.float64],
+    radial_velocity: npt.NDArray[np.float64],
+    radial_distance: npt.NDArray[np.float64],
+    method: options.NoiseMaskMethod,
+    block_profiles: int,
+    workers: int = 1,
+) -> npt.NDArray[np.bool_]:
+    """
+    Same as _compute_noise_mask but without full size temporary arrays.
+    The moving means of each block run on workers threads.
+
+    Each block is extended with half a moving mean window on both sides.
+    uniform_filter1d keeps a running sum over time, so the moving means of a
+    block agree with those of all profiles at once only up to rounding. The
+    mask can differ only where a mean is within rounding of its threshold.
+    """
+    ntimes = len(intensity)
+    halo = _NOISE_MASK_TIME_WINDOW // 2
+    mask = np.empty(intensity.shape, dtype=np.bool_)
+    for start in range(0, ntimes, block_profiles):
+        stop = min(ntimes, start + block_profiles)
+        lo = max(0, start - halo)
+        hi = min(ntimes, stop + halo)
+        rows = slice(start - lo, stop - lo)
+        intensity_time_mean, velocity_time_mean = _noise_mask_time_means(
+            intensity[lo:hi], radial_velocity[lo:hi], method, workers
+        )
+        mask[start:stop] = _noise_mask_from_time_means(
+            intensity[start:stop],
+            intensity_time_mean[rows],
+            velocity_time_mean[rows] if velocity_time_mean is not None else None,
+            radial_distance,
+            workers,
+        )
+    return mask
+
+
+def _halo_stare_in_blocks(
+    raw: doppy.raw.HaloHpl,
+    bg: doppy.raw.HaloBg,
+    bg_correction_method: options.BgCorrectionMethod,
+    noise_mask_method: options.NoiseMaskMethod,
+    block_profiles: int,
+    workers: int = 1,
+    bg_fit_cache: _BackgroundFitCache | None = None,
+    dtype: np.dtype[np.floating[Any]] = np.dtype(np.float64),
+) -> Stare:
+    """
+    Same as the corresponding part of Stare.from_halo_data, but the
+    background and noise bias corrections are done for blocks of profiles.
+    Each block is extended with _LOCATE_NOISE_TIME_HALO profiles on both
+    sides so that the noise detection sees the same neighbourhood as when
+    processing all profiles at once.
+    """
+    if block_profiles < 1:
+        raise ValueError("block_profiles must be positive")
+    bg_relevant = _select_relevant_background_profiles(bg, raw.time)
+    bg_signal_corrected = _compute_corrected_background_signal(
+        bg_relevant, raw.radial_distance, bg_correction_method, bg_fit_cache
+    )
+    raw, raw2bg = _select_profiles_with_background(raw, bg_relevant)
+    if len(raw.time) == 0:
+        raise doppy.exceptions.NoDataError("No matching data and bg files")
+
+    wavelength = defaults.Halo.wavelength
+    ntimes = len(raw.time)
+    intensity = np.empty_like(raw.intensity)
+    beta = np.empty(raw.intensity.shape, dtype=dtype)
+    for start in range(0, ntimes, block_profiles):
+        stop = min(ntimes, start + block_profiles)
+        ctx_start = max(0, start - _LOCATE_NOISE_TIME_HALO)
+        ctx_stop = min(ntimes, stop + _LOCATE_NOISE_TIME_HALO)
+        intensity_bg_corrected = _background_corrected_intensity(
+            raw.intensity[ctx_start:ctx_stop],
+            bg_relevant,
+            bg_signal_corrected,
+            raw2bg[ctx_start:ctx_stop],
+        )
+        block = slice(start - ctx_start, stop - ctx_start)
+        _correct_intensity_noise_bias_with_noise_mask(
+            raw.radial_distance,
+            intensity_bg_corrected[block],
+            _locate_noise(intensity_bg_corrected, workers)[block],
+            out=intensity[start:stop],
+        )
+        _compute_beta(
+            snr=np.asarray(intensity[start:stop] - 1, dtype=dtype),
+            radial_distance=raw.radial_distance,
+            wavelength=wavelength,
+            beam_energy=defaults.Halo.beam_energy,
+            receiver_bandwidth=defaults.Halo.receiver_bandwidth,
+            focus=raw.header.focus_range,
+            effective_diameter=defaults.Halo.effective_diameter,
+            out=beta[start:stop],
+        )
+
+    radial_velocity = raw.radial_velocity.astype(dtype, copy=False)
+    mask_beta = _compute_noise_mask_in_blocks(
+        intensity,
+        radial_velocity,
+        raw.radial_distance,
+        noise_mask_method,
+        block_profiles,
+        workers,
+    )
+    match noise_mask_method:
+        case options.NoiseMaskMethod.INTENSITY_AND_VELOCITY:
+            mask_radial_velocity = np.empty_like(mask_beta)
+            for start in range(0, ntimes, block_profiles):
+                rows = slice(start, start + block_profiles)
+                mask_radial_velocity[rows] = detect_wind_noise(
+                    radial_velocity[rows], raw.radial_distance, mask_beta[rows]
+                )
+        case options.NoiseMaskMethod.INTENSITY_ONLY:
+            mask_radial_velocity = mask_beta.copy()
+
+    # intensity is not needed anymore, so reuse it for snr
+    intensity -= 1
+    snr = intensity.astype(dtype, copy=False)
+    return Stare(
+        time=raw.time,
+        radial_distance=raw.radial_distance,
+        elevation=raw.elevation,
+        beta=beta,
+        snr=snr,
+        radial_velocity=radial_velocity,
+        mask_beta=mask_beta,
+        mask_radial_velocity=mask_radial_velocity,
+        wavelength=wavelength,
+        system_id=raw.header.system_id,
+        ray_info=PulsesPerRay(raw.header.pulses_per_ray),
+    )
+
+
 def _compute_beta(
     snr: npt.NDArray[np.float64],
     radial_distance: npt.NDArray[np.float64],
@@ -345,12 +680,16 @@ def _compute_beta(
     receiver_bandwidth: float,
     focus: float,
     effective_diameter: float,
+    out: npt.NDArray[np.float64] | None = None,
 ) -> npt.NDArray[np.float64]:
     """
     Parameters
     ----------
     snr
         for halo: intensity - 1
+    out
+        array of the shape and type of snr for the result, a new array is
+        allocated if not given
     radial_distance
         distance from the instrument
     focus
@@ -381,6 +720,7 @@ def _compute_beta(
             Antti Juhani Manninen, and Pablo Ortiz-Amezcua
         doi: https://doi.org/10.5194/amt-13-2849-2020
     """
+    import scipy.constants
 
     h = scipy.constants.Planck
     c = scipy.constants.speed_of_light
@@ -391,8 +731,13 @@ def _compute_beta(
     A_e = _compute_effective_receiver_energy(
         radial_distance, wavelength, focus, effective_diameter
     )
-    beta = 2 * h * nu * B * radial_distance**2 * snr / (eta * c * E * A_e)
-    return np.array(beta, dtype=np.float64)
+    # Range dependent factors are computed in float64 and cast to the type of
+    # snr so that the 2D operations stay in that type
+    numerator = (2 * h * nu * B * radial_distance**2).astype(snr.dtype, copy=False)
+    denominator = (eta * c * E * A_e).astype(snr.dtype, copy=False)
+    beta: npt.NDArray[np.float64] = np.multiply(snr, numerator, out=out)
+    np.divide(beta, denominator, out=beta)
+    return beta
 
 
 def _compute_effective_receiver_energy(
@@ -433,7 +778,7 @@ def _compute_effective_receiver_energy(
 
 
 def _correct_intensity_noise_bias(
-    raw: doppy.raw.HaloHpl, intensity: npt.NDArray[np.float64]
+    raw: doppy.raw.HaloHpl, intensity: npt.NDArray[np.float64], workers: int = 1
 ) -> npt.NDArray[np.float64]:
     """
     Parameters
@@ -441,33 +786,68 @@ def _correct_intensity_noise_bias(
     intensity:
         intensity after background correction
     """
-    noise_mask = _locate_noise(intensity)
+    return _correct_intensity_noise_bias_with_noise_mask(
+        raw.radial_distance, intensity, _locate_noise(intensity, workers)
+    )
+
+
+def _correct_intensity_noise_bias_with_noise_mask(
+    radial_distance: npt.NDArray[np.float64],
+    intensity: npt.NDArray[np.float64],
+    noise_mask: npt.NDArray[np.bool_],
+    out: npt.NDArray[np.float64] | None = None,
+) -> npt.NDArray[np.float64]:
+    """
+    Fits the noise floor of each profile separately, so the result for a
+    profile depends only on its own intensity and noise mask.
+
+    The per profile design matrices and their pseudo-inverses take several
+    times the memory of intensity, so they are built for chunks of
+    _NOISE_FIT_CHUNK_PROFILES profiles at a time.
+
+    Parameters
+    ----------
+    out
+        array of the shape of intensity for the result, a new array is
+        allocated if not given
+    """
     # Ignore lower gates
-    noise_mask[:, raw.radial_distance <= 90] = False
+    noise_mask[:, radial_distance <= 90] = False
 
     A_ = np.concatenate(
         (
-            raw.radial_distance[:, np.newaxis],
-            np.ones((len(raw.radial_distance), 1)),
+            radial_distance[:, np.newaxis],
+            np.ones((len(radial_distance), 1)),
         ),
         axis=1,
     )[np.newaxis, :, :]
-    A = np.tile(
-        A_,
-        (len(intensity), 1, 1),
-    )
-    A_noise = np.tile(noise_mask[:, :, np.newaxis], (1, 1, 2))
-    A[~A_noise] = 0
-    intensity_ = intensity.copy()
-    intensity_[~noise_mask] = 0
+    if out is None:
+        out = np.empty_like(intensity)
+    for start in range(0, len(intensity), _NOISE_FIT_CHUNK_PROFILES):
+        rows = slice(start, start + _NOISE_FIT_CHUNK_PROFILES)
+        A = A_ * noise_mask[rows, :, np.newaxis]
+        intensity_noise = np.where(noise_mask[rows], intensity[rows], 0)
+        x = np.linalg.pinv(A) @ intensity_noise[:, :, np.newaxis]
+        noise_fit = (A_ @ x).squeeze(axis=2)
+        np.divide(intensity[rows], noise_fit, out=out[rows])
+    return out
+
 
-    A_pinv = np.linalg.pinv(A)
-    x = A_pinv @ intensity_[:, :, np.newaxis]
-    noise_fit = (A_ @ x).squeeze(axis=2)
-    return np.array(intensity / noise_fit, dtype=np.float64)
+_NOISE_FIT_CHUNK_PROFILES = 256
 
 
-def _locate_noise(intensity: npt.NDArray[np.float64]) -> npt.NDArray[np.bool_]:
+_LOCATE_NOISE_MEDIAN_KERNEL_SIZE = 5
+_LOCATE_NOISE_GAUSSIAN_RADIUS = 16
+# Number of neighbouring profiles on each side that affect the result of
+# _locate_noise for a profile
+_LOCATE_NOISE_TIME_HALO = (
+    _LOCATE_NOISE_MEDIAN_KERNEL_SIZE // 2 + _LOCATE_NOISE_GAUSSIAN_RADIUS
+)
+
+
+def _locate_noise(
+    intensity: npt.NDArray[np.float64], workers: int = 1
+) -> npt.NDArray[np.bool_]:
     """
     Returns
     -------
@@ -475,7 +855,6 @@ def _locate_noise(intensity: npt.NDArray[np.float64]) -> npt.NDArray[np.bool_]:
         where M[i,j] = True if intensity[i,j] contains only noise
         and False otherwise
     """
-
     INTENSITY_THRESHOLD = 1.008
     MEDIAN_KERNEL_THRESHOLD = 1.002
     GAUSSIAN_THRESHOLD = 0.02
@@ -484,12 +863,19 @@ def _locate_noise(intensity: npt.NDArray[np.float64]) -> npt.NDArray[np.bool_]:
     intensity_mask = intensity_normalised > INTENSITY_THRESHOLD
 
     median_mask = (
-        scipy.signal.medfilt2d(intensity_normalised, kernel_size=5)
+        tiling.medfilt2d(
+            intensity_normalised,
+            kernel_size=_LOCATE_NOISE_MEDIAN_KERNEL_SIZE,
+            workers=workers,
+        )
         > MEDIAN_KERNEL_THRESHOLD
     )
 
-    gaussian = scipy.ndimage.gaussian_filter(
-        (intensity_mask | median_mask).astype(np.float64), sigma=8, radius=16
+    gaussian = tiling.gaussian_filter(
+        (intensity_mask | median_mask).astype(np.float64),
+        sigma=8,
+        radius=_LOCATE_NOISE_GAUSSIAN_RADIUS,
+        workers=workers,
     )
     gaussian_mask = gaussian > GAUSSIAN_THRESHOLD
 
@@ -500,6 +886,7 @@ def _correct_background(
     raw: doppy.raw.HaloHpl,
     bg: doppy.raw.HaloBg,
     method: options.BgCorrectionMethod,
+    bg_fit_cache: _BackgroundFitCache | None = None,
 ) -> Tuple[doppy.raw.HaloHpl, npt.NDArray[np.float64]]:
     """
     Returns
@@ -517,26 +904,143 @@ def _correct_background(
         more accurately
     """
     bg_relevant = _select_relevant_background_profiles(bg, raw.time)
+    bg_signal_corrected = _compute_corrected_background_signal(
+        bg_relevant, raw.radial_distance, method, bg_fit_cache
+    )
+    return _apply_background_correction(raw, bg_relevant, bg_signal_corrected)
+
+
+def _compute_corrected_background_signal(
+    bg: doppy.raw.HaloBg,
+    radial_distance: npt.NDArray[np.float64],
+    method: options.BgCorrectionMethod,
+    bg_fit_cache: _BackgroundFitCache | None = None,
+) -> npt.NDArray[np.float64]:
+    if bg_fit_cache is not None:
+        return bg_fit_cache.get_or_compute(
+            bg,
+            radial_distance,
+            method,
+            lambda: _compute_corrected_background_signal(bg, radial_distance, method),
+        )
     match method:
         case options.BgCorrectionMethod.FIT:
-            bg_signal_corrected = _correct_background_by_fitting(
-                bg_relevant, raw.radial_distance, fit_method=None
-            )
+            return _correct_background_by_fitting(bg, radial_distance, fit_method=None)
         case options.BgCorrectionMethod.MEAN:
             raise NotImplementedError
         case options.BgCorrectionMethod.PRE_COMPUTED:
             raise NotImplementedError
 
-    raw2bg = np.searchsorted(bg_relevant.time, raw.time, side="right") - 1
-    raw_with_bg = raw[raw2bg >= 0]
-    raw2bg = raw2bg[raw2bg >= 0]
-    raw_bg_original = bg_relevant.signal[raw2bg]
-    raw_bg_corrected = bg_signal_corrected[raw2bg]
 
-    intensity_bg_corrected = raw_with_bg.intensity * raw_bg_original / raw_bg_corrected
+def _apply_background_correction(
+    raw: doppy.raw.HaloHpl,
+    bg_relevant: doppy.raw.HaloBg,
+    bg_signal_corrected: npt.NDArray[np.float64],
+) -> Tuple[doppy.raw.HaloHpl, npt.NDArray[np.float64]]:
+    raw_with_bg, raw2bg = _select_profiles_with_background(raw, bg_relevant)
+    intensity_bg_corrected = _background_corrected_intensity(
+        raw_with_bg.intensity, bg_relevant, bg_signal_corrected, raw2bg
+    )
     return raw_with_bg, intensity_bg_corrected
 
 
+def _select_profiles_with_background(
+    raw: doppy.raw.HaloHpl, bg_relevant: doppy.raw.HaloBg
+) -> Tuple[doppy.raw.HaloHpl, npt.NDArray[np.int64]]:
+    """
+    Returns
+    -------
+    raw_with_bg
+        profiles of raw that have a preceding background measurement
+    raw2bg
+        index of the background profile for each profile in raw_with_bg
+    """
+    raw2bg = np.searchsorted(bg_relevant.time, raw.time, side="right") - 1
+    if np.all(raw2bg >= 0):
+        return raw, raw2bg
+    return raw[raw2bg >= 0], raw2bg[raw2bg >= 0]
+
+
+def _background_corrected_intensity(
+    intensity: npt.NDArray[np.float64],
+    bg_relevant: doppy.raw.HaloBg,
+    bg_signal_corrected: npt.NDArray[np.float64],
+    raw2bg: npt.NDArray[np.int64],
+) -> npt.NDArray[np.float64]:
+    """
+    Returns intensity * original background / corrected background, where
+    each profile uses the background profile raw2bg points to.
+
+    Consecutive profiles share the same background profile, so the result
+    is computed for each run of equal raw2bg values without gathering the
+    background profiles into full size arrays.
+    """
+    intensity_bg_corrected = np.empty(intensity.shape, dtype=np.float64)
+    if len(raw2bg) == 0:
+        return intensity_bg_corrected
+    run_starts = np.concatenate(([0], np.flatnonzero(np.diff(raw2bg)) + 1))
+    run_stops = np.concatenate((run_starts[1:], [len(raw2bg)]))
+    for start, stop in zip(run_starts, run_stops):
+        rows = slice(start, stop)
+        ibg = raw2bg[start]
+        np.multiply(
+            intensity[rows], bg_relevant.signal[ibg], out=intensity_bg_corrected[rows]
+        )
+        np.divide(
+            intensity_bg_corrected[rows],
+            bg_signal_corrected[ibg],
+            out=intensity_bg_corrected[rows],
+        )
+    return intensity_bg_corrected
+
+
+class _BackgroundFitCache:
+    """
+    Corrected background signals keyed by the background profiles, range
+    gates and correction method. Safe to share between threads: if two
+    threads need the same fit, one computes it and the other waits.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._fits: dict[bytes, Future[npt.NDArray[np.float64]]] = {}
+
+    def get_or_compute(
+        self,
+        bg: doppy.raw.HaloBg,
+        radial_distance: npt.NDArray[np.float64],
+        method: options.BgCorrectionMethod,
+        compute: Callable[[], npt.NDArray[np.float64]],
+    ) -> npt.NDArray[np.float64]:
+        key = _background_fit_key(bg, radial_distance, method)
+        with self._lock:
+            future = self._fits.get(key)
+            is_owner = future is None
+            if future is None:
+                future = self._fits[key] = Future()
+        if is_owner:
+            try:
+                future.set_result(compute())
+            except BaseException as err:
+                future.set_exception(err)
+                with self._lock:
+                    del self._fits[key]
+                raise
+        return future.result()
+
+
+def _background_fit_key(
+    bg: doppy.raw.HaloBg,
+    radial_distance: npt.NDArray[np.float64],
+    method: options.BgCorrectionMethod,
+) -> bytes:
+    h = hashlib.blake2b(method.value.encode())
+    for arr in (bg.time, bg.signal, radial_distance):
+        h.update(str((arr.dtype, arr.shape)).encode())
+        h.update(np.ascontiguousarray(arr).tobytes())
+    return h.digest()
+
+
 def _correct_background_by_fitting(
     bg: doppy.raw.HaloBg,
     radial_distance: npt.NDArray[np.float64],
@@ -556,15 +1060,16 @@ def _fit_background(
     radial_distance: npt.NDArray[np.float64],
     fit_method: options.BgFitMethod | None,
 ) -> npt.NDArray[np.float64]:
+    peaks = _detect_peaks(bg.signal, radial_distance)
     if fit_method is None:
-        fit_method = _infer_fit_type(bg.signal, radial_distance)
+        fit_method = _infer_fit_type(bg.signal, radial_distance, peaks)
     match fit_method:
         case options.BgFitMethod.LIN:
-            return _linear_fit(bg.signal, radial_distance)
+            return _linear_fit(bg.signal, radial_distance, peaks)
         case options.BgFitMethod.EXP:
-            return _exponential_fit(bg.signal, radial_distance)
+            return _exponential_fit(bg.signal, radial_distance, peaks)
         case options.BgFitMethod.EXPLIN:
-            return _exponential_linear_fit(bg.signal, radial_distance)
+            return _exponential_linear_fit(bg.signal, radial_distance, peaks)
 
 
 def _lin_func(
@@ -589,9 +1094,14 @@ def _explin_func(
 
 
 def _infer_fit_type(
-    bg_signal: npt.NDArray[np.float64], radial_distance: npt.NDArray[np.float64]
+    bg_signal: npt.NDArray[np.float64],
+    radial_distance: npt.NDArray[np.float64],
+    peaks: npt.NDArray[np.bool_] | None = None,
 ) -> options.BgFitMethod:
-    peaks = _detect_peaks(bg_signal, radial_distance)
+    import scipy.optimize
+
+    if peaks is None:
+        peaks = _detect_peaks(bg_signal, radial_distance)
     dist_mask = (90 < radial_distance) & (radial_distance < 8000)
     mask = dist_mask & ~peaks
 
@@ -670,10 +1180,13 @@ def _set_adjacent_true(arr: npt.NDArray[np.bool_]) -> npt.NDArray[np.bool_]:
 
 
 def _linear_fit(
-    bg_signal: npt.NDArray[np.float64], radial_distance: npt.NDArray[np.float64]
+    bg_signal: npt.NDArray[np.float64],
+    radial_distance: npt.NDArray[np.float64],
+    peaks: npt.NDArray[np.bool_] | None = None,
 ) -> npt.NDArray[np.float64]:
     dist_mask = 90 < radial_distance
-    peaks = _detect_peaks(bg_signal, radial_distance)
+    if peaks is None:
+        peaks = _detect_peaks(bg_signal, radial_distance)
     mask = dist_mask & ~peaks
 
     scale = np.median(bg_signal, axis=1)[:, np.newaxis]
@@ -695,10 +1208,15 @@ def _linear_fit(
 
 
 def _exponential_fit(
-    bg_signal: npt.NDArray[np.float64], radial_distance: npt.NDArray[np.float64]
+    bg_signal: npt.NDArray[np.float64],
+    radial_distance: npt.NDArray[np.float64],
+    peaks: npt.NDArray[np.bool_] | None = None,
 ) -> npt.NDArray[np.float64]:
+    import scipy.optimize
+
     dist_mask = 90 < radial_distance
-    peaks = _detect_peaks(bg_signal, radial_distance)
+    if peaks is None:
+        peaks = _detect_peaks(bg_signal, radial_distance)
     mask = dist_mask & ~peaks
     scale = np.median(bg_signal, axis=1)[:, np.newaxis]
     rdist_fit = radial_distance[np.newaxis][:, mask]
@@ -715,10 +1233,15 @@ def _exponential_fit(
 
 
 def _exponential_linear_fit(
-    bg_signal: npt.NDArray[np.float64], radial_distance: npt.NDArray[np.float64]
+    bg_signal: npt.NDArray[np.float64],
+    radial_distance: npt.NDArray[np.float64],
+    peaks: npt.NDArray[np.bool_] | None = None,
 ) -> npt.NDArray[np.float64]:
+    import scipy.optimize
+
     dist_mask = 90 < radial_distance
-    peaks = _detect_peaks(bg_signal, radial_distance)
+    if peaks is None:
+        peaks = _detect_peaks(bg_signal, radial_distance)
     mask = dist_mask & ~peaks
     scale = np.median(bg_signal, axis=1)[:, np.newaxis]
     rdist_fit = radial_distance[np.newaxis][:, mask]
@@ -737,18 +1260,185 @@ def _exponential_linear_fit(
     return np.array(fit * scale, dtype=np.float64)
 
 
+def _merge_raws_for_stare(raws: Sequence[doppy.raw.HaloHpl]) -> doppy.raw.HaloHpl:
+    return (
+        doppy.raw.HaloHpl.merge(raws)
+        .sorted_by_time()
+        .non_strictly_increasing_timesteps_removed()
+        .nans_removed()
+    )
+
+
+class _BackgroundParser:
+    """
+    Parses background files and remembers the result, so that a file given
+    for several products is parsed only once. Files given as paths are
+    identified by path and other files by content and filename.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._parsed: dict[tuple[str | bytes, str], list[doppy.raw.HaloBg]] = {}
+
+    def parse(
+        self, src: str | Path | tuple[bytes, str] | tuple[BufferedIOBase, str]
+    ) -> list[doppy.raw.HaloBg]:
+        data: str | Path | bytes
+        if isinstance(src, (str, Path)):
+            data, filename = src, Path(src).name
+            key: tuple[str | bytes, str] = (str(src), "")
+        else:
+            data = src[0] if isinstance(src[0], bytes) else src[0].read()
+            filename = src[1]
+            key = (data, filename)
+        with self._lock:
+            if key in self._parsed:
+                return self._parsed[key]
+        try:
+            bgs = [doppy.raw.HaloBg.from_src(data, filename)]
+        except doppy.exceptions.RawParsingError:
+            bgs = []
+        with self._lock:
+            self._parsed[key] = bgs
+        return bgs
+
+
+def _relevant_background_parser(
+    data_bg: Sequence[str]
+    | Sequence[Path]
+    | Sequence[tuple[bytes, str]]
+    | Sequence[tuple[BufferedIOBase, str]],
+    parser: _BackgroundParser | None = None,
+) -> Callable[[npt.NDArray[np.datetime64], int], list[doppy.raw.HaloBg]]:
+    parser_ = parser or _BackgroundParser()
+    return lambda time, ngates: _parse_relevant_backgrounds(
+        data_bg, time, ngates, parser_
+    )
+
+
+def _parse_relevant_backgrounds(
+    data_bg: Sequence[str]
+    | Sequence[Path]
+    | Sequence[tuple[bytes, str]]
+    | Sequence[tuple[BufferedIOBase, str]],
+    time: npt.NDArray[np.datetime64],
+    ngates: int,
+    parser: _BackgroundParser,
+) -> list[doppy.raw.HaloBg]:
+    """
+    Parses only the background files that _select_relevant_background_profiles
+    would keep for the given profile times. The time of a background profile
+    is known from its filename, so the relevant files can be found before
+    parsing. If a relevant file turns out to be unusable, the selection is
+    repeated without it.
+    """
+    if not isinstance(data_bg, (list, tuple)):
+        raise TypeError("data should be list or tuple")
+    srcs: list[str | Path | tuple[bytes, str] | tuple[BufferedIOBase, str]] = list(
+        data_bg
+    )
+    try:
+        bg_time = np.array(
+            [_time_from_filename(_src_filename(src)) for src in srcs],
+            dtype="datetime64[us]",
+        )
+    except ValueError:
+        # Parse everything to raise the same error as without prefiltering
+        return [bg for src in srcs for bg in parser.parse(src)]
+
+    parsed: dict[int, list[doppy.raw.HaloBg]] = {}
+    is_usable = np.ones(len(srcs), dtype=np.bool_)
+    while True:
+        candidate_time = np.unique(bg_time[is_usable])
+        time2bg_time = _time2bg_time(time, candidate_time)
+        relevant_time = candidate_time[np.unique(time2bg_time[time2bg_time >= 0])]
+        relevant = [
+            int(i) for i in np.flatnonzero(is_usable & np.isin(bg_time, relevant_time))
+        ]
+        if len(relevant) == 0:
+            return [bg for src in srcs for bg in parser.parse(src)]
+        unparsed = [i for i in relevant if i not in parsed]
+        if not unparsed:
+            return [bg for i in relevant for bg in parsed[i]]
+        for i in unparsed:
+            parsed[i] = [bg for bg in parser.parse(srcs[i]) if bg.ngates >= ngates]
+            is_usable[i] = len(parsed[i]) > 0
+
+
+def _merge_backgrounds_for_stare(
+    bgs: Sequence[doppy.raw.HaloBg], ngates: int
+) -> doppy.raw.HaloBg:
+    bgs = [bg[:, :ngates] for bg in bgs]
+    bgs_stare = [bg for bg in bgs if bg.ngates == ngates]
+
+    if len(bgs_stare) == 0:
+        raise doppy.exceptions.NoDataError("Background data missing")
+
+    return (
+        doppy.raw.HaloBg.merge(bgs_stare)
+        .sorted_by_time()
+        .non_strictly_increasing_timesteps_removed()
+    )
+
+
 def _select_raws_for_stare(
     raws: Sequence[doppy.raw.HaloHpl],
 ) -> Sequence[doppy.raw.HaloHpl]:
+    return _select_raws_in_stare_group(raws, _select_stare_group(raws))
+
+
+def _select_raws_in_stare_group(
+    raws: Sequence[doppy.raw.HaloHpl], group: tuple[int, int, int]
+) -> list[doppy.raw.HaloHpl]:
+    """
+    Profiles of raws that belong to group = (ngates, elevation, mergeable_hash)
+    """
+    ngates, elevation, mhash = group
+    raws_selected = []
+    for raw in raws:
+        if len(raw.radial_distance) == ngates and (
+            raw.header.mergeable_hash() == mhash
+        ):
+            select_profiles = np.isclose(raw.elevation, elevation, atol=1)
+            raw_selected = raw if select_profiles.all() else raw[select_profiles]
+            if raw_selected.time.size != 0:
+                raws_selected.append(raw_selected)
+    return raws_selected
+
+
+def _select_stare_group(
+    raws: Sequence[doppy.raw.HaloHpl],
+) -> tuple[int, int, int]:
+    """
+    Returns
+    -------
+    (ngates, elevation, mergeable_hash) of the most common vertical stare
+    configuration in raws
+    """
     if len(raws) == 0:
         raise doppy.exceptions.NoDataError("Expected at least one raw file")
-    counter_dd: DefaultDict[tuple[int, int, int], int] = defaultdict(int)
+    return _most_common_stare_group(_count_stare_groups(raws, defaultdict(int)))
+
+
+def _count_stare_groups(
+    raws: Sequence[doppy.raw.HaloHpl],
+    counter: DefaultDict[tuple[int, int, int], int],
+) -> DefaultDict[tuple[int, int, int], int]:
+    """
+    Adds the number of profiles of raws in each (ngates, elevation,
+    mergeable_hash) group to counter and returns it
+    """
     for raw in raws:
         els, counts = np.unique(np.rint(raw.elevation).astype(int), return_counts=True)
         ngates = len(raw.radial_distance)
         for el, count in zip(els, counts):
-            counter_dd[(ngates, el, raw.header.mergeable_hash())] += count
-    counter = dict(counter_dd)
+            counter[(ngates, el, raw.header.mergeable_hash())] += count
+    return counter
+
+
+def _most_common_stare_group(
+    counter: DefaultDict[tuple[int, int, int], int],
+) -> tuple[int, int, int]:
     elevation_angle_lb = 75
     elevation_angle_ub = 90
     counter_allowed = {
@@ -759,17 +1449,8 @@ def _select_raws_for_stare(
     if not counter_allowed:
         raise doppy.exceptions.NoDataError("No raw data suitable for stare product")
 
-    (ngates, elevation, mhash), count = max(counter_allowed.items(), key=lambda x: x[1])
-    raws_selected = []
-    for raw in raws:
-        if len(raw.radial_distance) == ngates and (
-            raw.header.mergeable_hash() == mhash
-        ):
-            select_profiles = np.isclose(raw.elevation, elevation, atol=1)
-            raw_selected = raw[select_profiles]
-            if raw_selected.time.size != 0:
-                raws_selected.append(raw_selected)
-    return raws_selected
+    (ngates, elevation, mhash), _ = max(counter_allowed.items(), key=lambda x: x[1])
+    return ngates, elevation, mhash
 
 
 def _time2bg_time(
@@ -795,6 +1476,8 @@ def _select_relevant_background_profiles(
 def _cluster_background_profiles(
     background_signal: npt.NDArray[np.float64], radial_distance: npt.NDArray[np.float64]
 ) -> npt.NDArray[np.int64]:
+    from sklearn.cluster import KMeans
+
     default_labels = np.zeros(len(background_signal), dtype=int)
     if len(background_signal) < 2:
         return default_labels
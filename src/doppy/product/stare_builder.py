@@ -0,0 +1,551 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from io import BufferedIOBase
+from pathlib import Path
+from typing import Any, DefaultDict, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+import doppy
+from doppy import defaults, options
+from doppy.product.noise_utils import detect_wind_noise
+from doppy.product.stare import (
+    _LOCATE_NOISE_TIME_HALO,
+    _NOISE_MASK_TIME_WINDOW,
+    PulsesPerRay,
+    Stare,
+    _background_corrected_intensity,
+    _compute_beta,
+    _compute_corrected_background_signal,
+    _correct_intensity_noise_bias_with_noise_mask,
+    _count_stare_groups,
+    _locate_noise,
+    _merge_backgrounds_for_stare,
+    _merge_raws_for_stare,
+    _most_common_stare_group,
+    _noise_mask_from_time_means,
+    _noise_mask_time_means,
+    _select_profiles_with_background,
+    _select_raws_in_stare_group,
+    _select_relevant_background_profiles,
+)
+from doppy.product.utils import compute_dtype
+
+
+class StareBuilder:
+    """
+    Builds a HALO stare product incrementally as new files arrive during the day.
+
+    Parsed raw and background files, the merged profiles, the fitted background
+    and the per profile intermediate results are kept between calls to
+    `append`. New HPL files that continue the day in time order are merged to
+    the stored profiles. Only new profiles, and profiles whose corrected
+    background changed, are background corrected. The noise detection is
+    repeated only for them and for the neighbouring profiles that its
+    time-direction filters depend on. The returned product is identical to
+    running `Stare.from_halo_data` on all the files given so far, except that
+    the noise mask can differ where its moving mean over time, which is
+    recomputed only near the new profiles, is within rounding of its
+    threshold.
+
+    A new background file that changes the fitted background of already
+    processed profiles causes those profiles to be reprocessed. Files that are
+    out of time order, or that change the selected stare configuration, cause
+    the profiles to be merged again.
+
+    The returned products do not share arrays with the builder or with each
+    other.
+
+    Examples
+    --------
+    >>> builder = StareBuilder()
+    >>> stare = builder.append(hpl_files_so_far, bg_files_so_far)
+    >>> stare = builder.append([new_hpl_file], [new_bg_file])
+    """
+
+    def __init__(
+        self,
+        bg_correction_method: options.BgCorrectionMethod = (
+            options.BgCorrectionMethod.FIT
+        ),
+        noise_mask_method: options.NoiseMaskMethod = (
+            options.NoiseMaskMethod.INTENSITY_AND_VELOCITY
+        ),
+        workers: int = 1,
+        dtype: npt.DTypeLike = np.float64,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        workers
+            number of threads used for the noise filters
+        dtype
+            floating point type of the product, see Stare.from_halo_data
+        """
+        self.bg_correction_method = bg_correction_method
+        self.noise_mask_method = noise_mask_method
+        self.workers = workers
+        self.dtype = compute_dtype(dtype)
+        self._raws: list[doppy.raw.HaloHpl] = []
+        self._group_counts: DefaultDict[tuple[int, int, int], int] = defaultdict(int)
+        self._merged: _MergedRaw | None = None
+        self._bgs: list[doppy.raw.HaloBg] = []
+        self._bg_relevant: doppy.raw.HaloBg | None = None
+        self._bg_signal_corrected: npt.NDArray[np.float64] | None = None
+        self._state: _StareState | None = None
+
+    @property
+    def stare(self) -> Stare:
+        if self._state is None:
+            raise doppy.exceptions.NoDataError("No stare data processed yet")
+        return self._state.to_stare()
+
+    def append(
+        self,
+        data: Sequence[str]
+        | Sequence[Path]
+        | Sequence[bytes]
+        | Sequence[BufferedIOBase],
+        data_bg: Sequence[str]
+        | Sequence[Path]
+        | Sequence[tuple[bytes, str]]
+        | Sequence[tuple[BufferedIOBase, str]] = (),
+    ) -> Stare:
+        """
+        Adds new HPL and background files and returns the updated product.
+        """
+        new_raws = doppy.raw.HaloHpl.from_srcs(data)
+        self._raws.extend(new_raws)
+        _count_stare_groups(new_raws, self._group_counts)
+        if len(data_bg) > 0:
+            self._bgs.extend(doppy.raw.HaloBg.from_srcs(data_bg))
+
+        if len(self._raws) == 0:
+            raise doppy.exceptions.NoDataError("HaloHpl data missing")
+
+        raw, appended = self._merge(_most_common_stare_group(self._group_counts))
+        bg = _merge_backgrounds_for_stare(self._bgs, raw.header.ngates)
+        bg_relevant = _select_relevant_background_profiles(bg, raw.time)
+        bg_signal_corrected = self._corrected_background_signal(
+            bg_relevant, raw.radial_distance
+        )
+        raw, raw2bg = _select_profiles_with_background(raw, bg_relevant)
+        if len(raw.time) == 0:
+            raise doppy.exceptions.NoDataError("No matching data and bg files")
+
+        self._state = _update_state(
+            self._state,
+            _BackgroundCorrection(raw2bg, bg_relevant, bg_signal_corrected),
+            raw,
+            appended,
+            self.noise_mask_method,
+            self.workers,
+            self.dtype,
+        )
+        return self._state.to_stare()
+
+    def _merge(self, group: tuple[int, int, int]) -> tuple[doppy.raw.HaloHpl, bool]:
+        """
+        Returns the merged profiles of group and whether they were appended to
+        the previously merged profiles, i.e. whether profiles with the same
+        time as before have the same data.
+
+        If the profiles of the new files are in time order and later than all
+        merged profiles, sorting and removing duplicate times would not change
+        the merged profiles, and merging only the new files gives the same
+        result as merging all files again.
+        """
+        merged = self._merged
+        if merged is not None and merged.group == group and merged.is_increasing:
+            new_raws = _select_raws_in_stare_group(self._raws[merged.nraws :], group)
+            new_time = _concatenated_time(new_raws)
+            if len(new_time) == 0:
+                self._merged = merged.extended(len(self._raws), merged.raw, None)
+                return merged.raw, True
+            if (merged.last_time is None or new_time[0] > merged.last_time) and bool(
+                np.all(new_time[1:] > new_time[:-1])
+            ):
+                tail = doppy.raw.HaloHpl.merge(new_raws).nans_removed()
+                raw = (
+                    doppy.raw.HaloHpl.merge([merged.raw, tail])
+                    if len(tail.time) > 0
+                    else merged.raw
+                )
+                self._merged = merged.extended(len(self._raws), raw, new_time[-1])
+                return raw, True
+
+        selected = _select_raws_in_stare_group(self._raws, group)
+        time = _concatenated_time(selected)
+        raw = _merge_raws_for_stare(selected)
+        self._merged = _MergedRaw(
+            group=group,
+            raw=raw,
+            nraws=len(self._raws),
+            last_time=time[-1] if len(time) > 0 else None,
+            is_increasing=bool(np.all(time[1:] > time[:-1])),
+        )
+        return raw, False
+
+    def _corrected_background_signal(
+        self,
+        bg_relevant: doppy.raw.HaloBg,
+        radial_distance: npt.NDArray[np.float64],
+    ) -> npt.NDArray[np.float64]:
+        if (
+            self._bg_relevant is None
+            or self._bg_signal_corrected is None
+            or not np.array_equal(self._bg_relevant.time, bg_relevant.time)
+            or not np.array_equal(self._bg_relevant.signal, bg_relevant.signal)
+        ):
+            self._bg_signal_corrected = _compute_corrected_background_signal(
+                bg_relevant, radial_distance, self.bg_correction_method
+            )
+            self._bg_relevant = bg_relevant
+        return self._bg_signal_corrected
+
+
+class _MergedRaw:
+    """
+    Merged profiles of the selected stare group
+
+    Parameters
+    ----------
+    nraws
+        number of parsed files merged so far
+    last_time
+        time of the last profile of the files in the order they were given
+    is_increasing
+        whether the profiles of the files, in the order they were given,
+        have strictly increasing times
+    """
+
+    def __init__(
+        self,
+        group: tuple[int, int, int],
+        raw: doppy.raw.HaloHpl,
+        nraws: int,
+        last_time: np.datetime64 | None,
+        is_increasing: bool,
+    ) -> None:
+        self.group = group
+        self.raw = raw
+        self.nraws = nraws
+        self.last_time = last_time
+        self.is_increasing = is_increasing
+
+    def extended(
+        self, nraws: int, raw: doppy.raw.HaloHpl, last_time: np.datetime64 | None
+    ) -> _MergedRaw:
+        return _MergedRaw(
+            group=self.group,
+            raw=raw,
+            nraws=nraws,
+            last_time=last_time if last_time is not None else self.last_time,
+            is_increasing=True,
+        )
+
+
+def _concatenated_time(
+    raws: Sequence[doppy.raw.HaloHpl],
+) -> npt.NDArray[np.datetime64]:
+    if len(raws) == 0:
+        return np.array([], dtype="datetime64[us]")
+    return np.concatenate([raw.time for raw in raws])
+
+
+class _BackgroundCorrection:
+    """
+    Parameters
+    ----------
+    raw2bg
+        index of the background profile of bg_relevant for each profile
+    """
+
+    def __init__(
+        self,
+        raw2bg: npt.NDArray[np.int64],
+        bg_relevant: doppy.raw.HaloBg,
+        bg_signal_corrected: npt.NDArray[np.float64],
+    ) -> None:
+        self.raw2bg = raw2bg
+        self.bg_relevant = bg_relevant
+        self.bg_signal_corrected = bg_signal_corrected
+
+    def corrected_intensity(
+        self, raw: doppy.raw.HaloHpl, start: int, stop: int
+    ) -> npt.NDArray[np.float64]:
+        return _background_corrected_intensity(
+            raw.intensity[start:stop],
+            self.bg_relevant,
+            self.bg_signal_corrected,
+            self.raw2bg[start:stop],
+        )
+
+
+class _StareState:
+    def __init__(
+        self,
+        raw: doppy.raw.HaloHpl,
+        bg: _BackgroundCorrection,
+        intensity_bg_corrected: npt.NDArray[np.float64],
+        intensity_noise_bias_corrected: npt.NDArray[np.float64],
+        beta: npt.NDArray[np.float64],
+        intensity_time_mean: npt.NDArray[np.float64],
+        velocity_time_mean: npt.NDArray[np.float64] | None,
+        mask_beta: npt.NDArray[np.bool_],
+        mask_radial_velocity: npt.NDArray[np.bool_],
+    ) -> None:
+        self.raw = raw
+        self.bg = bg
+        self.intensity_bg_corrected = intensity_bg_corrected
+        self.intensity_noise_bias_corrected = intensity_noise_bias_corrected
+        self.beta = beta
+        self.intensity_time_mean = intensity_time_mean
+        self.velocity_time_mean = velocity_time_mean
+        self.mask_beta = mask_beta
+        self.mask_radial_velocity = mask_radial_velocity
+
+    def to_stare(self) -> Stare:
+        dtype = self.beta.dtype
+        return Stare(
+            time=self.raw.time.copy(),
+            radial_distance=self.raw.radial_distance.copy(),
+            elevation=self.raw.elevation.copy(),
+            beta=self.beta.copy(),
+            snr=np.asarray(self.intensity_noise_bias_corrected - 1, dtype=dtype),
+            radial_velocity=self.raw.radial_velocity.astype(dtype),
+            mask_beta=self.mask_beta.copy(),
+            mask_radial_velocity=self.mask_radial_velocity.copy(),
+            wavelength=defaults.Halo.wavelength,
+            system_id=self.raw.header.system_id,
+            ray_info=PulsesPerRay(self.raw.header.pulses_per_ray),
+        )
+
+
+def _update_state(
+    prev: _StareState | None,
+    bg: _BackgroundCorrection,
+    raw: doppy.raw.HaloHpl,
+    appended: bool,
+    noise_mask_method: options.NoiseMaskMethod,
+    workers: int = 1,
+    dtype: np.dtype[np.floating[Any]] = np.dtype(np.float64),
+) -> _StareState:
+    """
+    Parameters
+    ----------
+    appended
+        True if profiles of raw with the same time as in prev have the same data
+    """
+    n = len(raw.time)
+    changed, ncommon = _changed_profiles(prev, raw, bg, appended)
+
+    intensity_bg_corrected = np.empty(raw.intensity.shape, dtype=np.float64)
+    intensity = np.empty(raw.intensity.shape, dtype=np.float64)
+    beta = np.empty(raw.intensity.shape, dtype=dtype)
+    if prev is not None:
+        intensity_bg_corrected[:ncommon] = prev.intensity_bg_corrected[:ncommon]
+        intensity[:ncommon] = prev.intensity_noise_bias_corrected[:ncommon]
+        beta[:ncommon] = prev.beta[:ncommon]
+    for start, stop in _runs(changed):
+        intensity_bg_corrected[start:stop] = bg.corrected_intensity(raw, start, stop)
+
+    reprocess = _dilate(changed, _LOCATE_NOISE_TIME_HALO)
+    for start, stop in _runs(reprocess):
+        ctx_start = max(0, start - _LOCATE_NOISE_TIME_HALO)
+        ctx_stop = min(n, stop + _LOCATE_NOISE_TIME_HALO)
+        noise_mask = _locate_noise(intensity_bg_corrected[ctx_start:ctx_stop], workers)
+        intensity[start:stop] = _correct_intensity_noise_bias_with_noise_mask(
+            raw.radial_distance,
+            intensity_bg_corrected[start:stop],
+            noise_mask[start - ctx_start : stop - ctx_start],
+        )
+        _compute_beta(
+            snr=np.asarray(intensity[start:stop] - 1, dtype=dtype),
+            radial_distance=raw.radial_distance,
+            wavelength=defaults.Halo.wavelength,
+            beam_energy=defaults.Halo.beam_energy,
+            receiver_bandwidth=defaults.Halo.receiver_bandwidth,
+            focus=raw.header.focus_range,
+            effective_diameter=defaults.Halo.effective_diameter,
+            out=beta[start:stop],
+        )
+
+    # The moving mean over time is recomputed only for profiles whose window
+    # reaches a reprocessed profile or, through the reflected boundary, the
+    # end of the previous day. It is computed from a slice that starts half a
+    # window earlier, so it agrees with a whole-day run up to rounding.
+    halo = _NOISE_MASK_TIME_WINDOW // 2
+    first_reprocessed = int(np.argmax(reprocess)) if reprocess.any() else n
+    keep = 0 if prev is None else max(0, min(first_reprocessed, ncommon) - halo)
+    ctx_start = max(0, keep - halo)
+    intensity_time_mean_new, velocity_time_mean_new = _noise_mask_time_means(
+        intensity[ctx_start:],
+        raw.radial_velocity[ctx_start:].astype(dtype, copy=False),
+        noise_mask_method,
+        workers,
+    )
+    intensity_time_mean = _concatenate_rows(
+        prev.intensity_time_mean if prev is not None else None,
+        intensity_time_mean_new,
+        keep,
+        keep - ctx_start,
+    )
+    velocity_time_mean = (
+        _concatenate_rows(
+            prev.velocity_time_mean if prev is not None else None,
+            velocity_time_mean_new,
+            keep,
+            keep - ctx_start,
+        )
+        if velocity_time_mean_new is not None
+        else None
+    )
+    mask_beta = np.empty(raw.intensity.shape, dtype=np.bool_)
+    if prev is not None:
+        mask_beta[:keep] = prev.mask_beta[:keep]
+    mask_beta[keep:] = _noise_mask_from_time_means(
+        intensity[keep:],
+        intensity_time_mean[keep:],
+        velocity_time_mean[keep:] if velocity_time_mean is not None else None,
+        raw.radial_distance,
+        workers,
+    )
+
+    match noise_mask_method:
+        case options.NoiseMaskMethod.INTENSITY_AND_VELOCITY:
+            mask_radial_velocity = np.empty_like(mask_beta)
+            redetect = changed.copy()
+            if prev is not None:
+                redetect[keep:ncommon] |= np.any(
+                    mask_beta[keep:ncommon] != prev.mask_beta[keep:ncommon], axis=1
+                )
+                mask_radial_velocity[:ncommon] = prev.mask_radial_velocity[:ncommon]
+            if redetect.any():
+                mask_radial_velocity[redetect] = detect_wind_noise(
+                    raw.radial_velocity[redetect].astype(dtype, copy=False),
+                    raw.radial_distance,
+                    mask_beta[redetect],
+                )
+        case options.NoiseMaskMethod.INTENSITY_ONLY:
+            mask_radial_velocity = mask_beta.copy()
+
+    return _StareState(
+        raw=raw,
+        bg=bg,
+        intensity_bg_corrected=intensity_bg_corrected,
+        intensity_noise_bias_corrected=intensity,
+        beta=beta,
+        intensity_time_mean=intensity_time_mean,
+        velocity_time_mean=velocity_time_mean,
+        mask_beta=mask_beta,
+        mask_radial_velocity=mask_radial_velocity,
+    )
+
+
+def _concatenate_rows(
+    prev: npt.NDArray[np.float64] | None,
+    new: npt.NDArray[np.float64],
+    keep: int,
+    offset: int,
+) -> npt.NDArray[np.float64]:
+    """
+    First keep rows of prev followed by the rows of new from offset on
+    """
+    if prev is None or keep == 0:
+        return new[offset:]
+    return np.concatenate((prev[:keep], new[offset:]))
+
+
+def _changed_profiles(
+    prev: _StareState | None,
+    raw: doppy.raw.HaloHpl,
+    bg: _BackgroundCorrection,
+    appended: bool,
+) -> tuple[npt.NDArray[np.bool_], int]:
+    """
+    Returns
+    -------
+    changed
+        changed[t] = True iff the background corrected intensity of profile t
+        was not computed before from the same input
+    ncommon
+        number of leading profiles whose index is the same as in prev
+    """
+    n = len(raw.time)
+    changed = np.ones(n, dtype=np.bool_)
+    if (
+        prev is None
+        or prev.raw.header.mergeable_hash() != raw.header.mergeable_hash()
+        or not np.array_equal(prev.raw.radial_distance, raw.radial_distance)
+    ):
+        return changed, 0
+
+    nmin = min(n, len(prev.raw.time))
+    same_time = prev.raw.time[:nmin] == raw.time[:nmin]
+    ncommon = nmin if same_time.all() else int(np.argmin(same_time))
+
+    bg_time = bg.bg_relevant.time[bg.raw2bg[:ncommon]]
+    prev_bg_time = prev.bg.bg_relevant.time[prev.bg.raw2bg[:ncommon]]
+    same = (bg_time == prev_bg_time) & _unchanged_backgrounds(prev.bg, bg)[
+        bg.raw2bg[:ncommon]
+    ]
+    if not appended:
+        same &= _rows_equal(
+            prev.raw.intensity[:ncommon], raw.intensity[:ncommon]
+        ) & _rows_equal(
+            prev.raw.radial_velocity[:ncommon], raw.radial_velocity[:ncommon]
+        )
+    changed[:ncommon] = ~same
+    return changed, ncommon
+
+
+def _unchanged_backgrounds(
+    prev: _BackgroundCorrection, bg: _BackgroundCorrection
+) -> npt.NDArray[np.bool_]:
+    """
+    unchanged[i] = True iff background profile i of bg was in prev with the
+    same signal and corrected signal
+    """
+    if len(prev.bg_relevant.time) == 0:
+        return np.zeros(len(bg.bg_relevant.time), dtype=np.bool_)
+    ind = np.searchsorted(prev.bg_relevant.time, bg.bg_relevant.time)
+    ind = np.minimum(ind, len(prev.bg_relevant.time) - 1)
+    return np.array(
+        (prev.bg_relevant.time[ind] == bg.bg_relevant.time)
+        & _rows_equal(prev.bg_relevant.signal[ind], bg.bg_relevant.signal)
+        & _rows_equal(prev.bg_signal_corrected[ind], bg.bg_signal_corrected),
+        dtype=np.bool_,
+    )
+
+
+def _rows_equal(
+    a: npt.NDArray[np.float64], b: npt.NDArray[np.float64]
+) -> npt.NDArray[np.bool_]:
+    return np.array(
+        np.all((a == b) | (np.isnan(a) & np.isnan(b)), axis=1), dtype=np.bool_
+    )
+
+
+def _dilate(arr: npt.NDArray[np.bool_], halo: int) -> npt.NDArray[np.bool_]:
+    """
+    Returns a copy of arr where also halo elements on each side of each True
+    element are set True
+    """
+    cumsum = np.concatenate(([0], np.cumsum(arr)))
+    ind = np.arange(len(arr))
+    lo = np.maximum(ind - halo, 0)
+    hi = np.minimum(ind + halo + 1, len(arr))
+    return np.array(cumsum[hi] - cumsum[lo] > 0, dtype=np.bool_)
+
+
+def _runs(arr: npt.NDArray[np.bool_]) -> list[tuple[int, int]]:
+    """
+    Returns (start, stop) index pairs of consecutive True elements in arr
+    """
+    edges = np.diff(np.concatenate(([False], arr, [False])).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1)
+    return [(int(a), int(b)) for a, b in zip(starts, stops)]
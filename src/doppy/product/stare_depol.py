@@ -1,16 +1,26 @@
 from __future__ import annotations
 
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from io import BufferedIOBase
 from pathlib import Path
-from typing import Sequence
+from typing import Any, BinaryIO, Callable, Sequence
 
 import numpy as np
 import numpy.typing as npt
 
 import doppy
 from doppy import options
-from doppy.product.stare import PulsesPerRay, RayAccumulationTime, Stare
+from doppy.product.stare import (
+    PulsesPerRay,
+    RayAccumulationTime,
+    Stare,
+    _BackgroundFitCache,
+    _BackgroundParser,
+    _relevant_background_parser,
+)
 
 
 @dataclass
@@ -184,134 +194,278 @@ class StareDepol:
         noise_mask_method: options.NoiseMaskMethod = (
             options.NoiseMaskMethod.INTENSITY_AND_VELOCITY
         ),
+        executor: options.Executor = options.Executor.SERIAL,
+        dtype: npt.DTypeLike = np.float64,
     ) -> StareDepol:
-        co = Stare.from_halo_data(
-            data=co_data,
-            data_bg=co_data_bg,
-            bg_correction_method=bg_correction_method,
-            noise_mask_method=noise_mask_method,
+        """
+        Parameters
+        ----------
+        executor
+            The co and cross products are independent until they are combined.
+            With Executor.SERIAL they are computed one after the other, with
+            Executor.THREAD or Executor.PROCESS concurrently. Executor.THREAD
+            overlaps only the steps that release the GIL, such as the SciPy
+            filters; HPL parsing holds it. Executor.PROCESS requires the data
+            sources to be picklable, e.g. paths or bytes.
+        dtype
+            floating point type of the co and cross products, see
+            Stare.from_halo_data
+
+        Background files that are given for both co and cross are parsed
+        once, and the fitted background is reused if both channels use the
+        same background profiles. With Executor.PROCESS the parsed files and
+        fits are not shared.
+        """
+        is_shared = executor != options.Executor.PROCESS
+        bg_parser = _BackgroundParser() if is_shared else None
+        bg_fit_cache = _BackgroundFitCache() if is_shared else None
+        co, cross = _co_and_cross_stares(
+            executor,
+            _stare_from_halo_data,
+            (co_data, co_data_bg),
+            (cross_data, cross_data_bg),
+            (bg_correction_method, noise_mask_method, bg_parser, bg_fit_cache, dtype),
         )
-        cross = Stare.from_halo_data(
-            data=cross_data,
-            data_bg=cross_data_bg,
-            bg_correction_method=bg_correction_method,
-            noise_mask_method=noise_mask_method,
+        return cls(co, cross, polariser_bleed_through)
+
+    @classmethod
+    def from_halo_raw(
+        cls,
+        co_raws: Sequence[doppy.raw.HaloHpl],
+        co_bgs: Sequence[doppy.raw.HaloBg],
+        cross_raws: Sequence[doppy.raw.HaloHpl],
+        cross_bgs: Sequence[doppy.raw.HaloBg],
+        bg_correction_method: options.BgCorrectionMethod = (
+            options.BgCorrectionMethod.FIT
+        ),
+        polariser_bleed_through: float = 0,
+        noise_mask_method: options.NoiseMaskMethod = (
+            options.NoiseMaskMethod.INTENSITY_AND_VELOCITY
+        ),
+        executor: options.Executor = options.Executor.SERIAL,
+        dtype: npt.DTypeLike = np.float64,
+    ) -> StareDepol:
+        """
+        Same as from_halo_data but for parsed HPL and background files
+        """
+        is_shared = executor != options.Executor.PROCESS
+        bg_fit_cache = _BackgroundFitCache() if is_shared else None
+        co, cross = _co_and_cross_stares(
+            executor,
+            _stare_from_halo_raw,
+            (co_raws, co_bgs),
+            (cross_raws, cross_bgs),
+            (bg_correction_method, noise_mask_method, bg_fit_cache, dtype),
         )
         return cls(co, cross, polariser_bleed_through)
 
-    def write_to_netcdf(self, filename: str | Path) -> None:
-        with doppy.netcdf.Dataset(filename) as nc:
-            nc.add_dimension("time")
-            nc.add_dimension("range")
-            nc.add_time(
-                name="time",
-                dimensions=("time",),
-                standard_name="time",
-                long_name="Time UTC",
-                data=self.time,
-                dtype="f8",
-            )
-            nc.add_variable(
-                name="range",
-                dimensions=("range",),
-                units="m",
-                data=self.radial_distance,
-                dtype="f4",
-            )
-            nc.add_variable(
-                name="elevation",
-                dimensions=("time",),
-                units="degrees",
-                data=self.elevation,
-                dtype="f4",
-                long_name="elevation from horizontal",
-            )
-            nc.add_variable(
-                name="beta_raw",
-                dimensions=("time", "range"),
-                units="sr-1 m-1",
-                data=self.beta,
-                dtype="f4",
-            )
-            nc.add_variable(
-                name="beta",
-                dimensions=("time", "range"),
-                units="sr-1 m-1",
-                data=self.beta,
-                dtype="f4",
-                mask=self.mask_beta,
-            )
-            nc.add_variable(
-                name="v",
-                dimensions=("time", "range"),
-                units="m s-1",
-                long_name="Doppler velocity",
-                data=self.radial_velocity,
-                dtype="f4",
-                mask=self.mask_radial_velocity,
-            )
-            nc.add_scalar_variable(
-                name="wavelength",
-                units="m",
-                standard_name="radiation_wavelength",
-                data=self.wavelength,
-                dtype="f4",
-            )
-            nc.add_variable(
-                name="depolarisation_raw",
-                dimensions=("time", "range"),
-                units="1",
-                data=self.depolarisation,
-                dtype="f4",
-                mask=self.mask_depolarisation,
-            )
-            nc.add_variable(
-                name="depolarisation",
-                dimensions=("time", "range"),
-                units="1",
-                data=self.depolarisation,
-                dtype="f4",
-                mask=self.mask_beta | self.mask_depolarisation,
-            )
-            nc.add_variable(
-                name="beta_cross_raw",
-                dimensions=("time", "range"),
-                units="sr-1 m-1",
-                data=self.beta_cross,
-                mask=self.mask_beta_cross,
-                dtype="f4",
-            )
-            nc.add_variable(
-                name="beta_cross",
-                dimensions=("time", "range"),
-                units="sr-1 m-1",
-                data=self.beta_cross,
-                mask=self.mask_beta | self.mask_beta_cross,
-                dtype="f4",
-            )
-            nc.add_scalar_variable(
-                name="polariser_bleed_through",
-                units="1",
-                long_name="Polariser bleed-through",
-                data=self.polariser_bleed_through,
-                dtype="f4",
+    def write_to_netcdf(
+        self,
+        filename: str | os.PathLike[str] | BinaryIO,
+        options: doppy.netcdf.WriterOptions | None = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        filename
+            path of the file, or any other object with a write method, e.g.
+            io.BytesIO, to which the encoded file is written as bytes
+        options
+            compression, chunking and quantization of the variables, the
+            defaults are used if None
+        """
+        doppy.netcdf.write_to_file(self._write_netcdf, filename, options=options)
+
+    def write_to_bytes(
+        self, options: doppy.netcdf.WriterOptions | None = None
+    ) -> bytes:
+        """
+        Returns the netCDF file as bytes without writing to disk
+        """
+        return doppy.netcdf.write_to_bytes(self._write_netcdf, options=options)
+
+    def _write_netcdf(self, nc: doppy.netcdf.Dataset) -> None:
+        nc.add_dimension("time")
+        nc.add_dimension("range")
+        nc.add_time(
+            name="time",
+            dimensions=("time",),
+            standard_name="time",
+            long_name="Time UTC",
+            data=self.time,
+            dtype="f8",
+        )
+        nc.add_variable(
+            name="range",
+            dimensions=("range",),
+            units="m",
+            data=self.radial_distance,
+            dtype="f4",
+        )
+        nc.add_variable(
+            name="elevation",
+            dimensions=("time",),
+            units="degrees",
+            data=self.elevation,
+            dtype="f4",
+            long_name="elevation from horizontal",
+        )
+        nc.add_variable(
+            name="beta_raw",
+            dimensions=("time", "range"),
+            units="sr-1 m-1",
+            data=self.beta,
+            dtype="f4",
+        )
+        nc.add_variable(
+            name="beta",
+            dimensions=("time", "range"),
+            units="sr-1 m-1",
+            data=self.beta,
+            dtype="f4",
+            mask=self.mask_beta,
+        )
+        nc.add_variable(
+            name="v",
+            dimensions=("time", "range"),
+            units="m s-1",
+            long_name="Doppler velocity",
+            data=self.radial_velocity,
+            dtype="f4",
+            mask=self.mask_radial_velocity,
+        )
+        nc.add_scalar_variable(
+            name="wavelength",
+            units="m",
+            standard_name="radiation_wavelength",
+            data=self.wavelength,
+            dtype="f4",
+        )
+        nc.add_variable(
+            name="depolarisation_raw",
+            dimensions=("time", "range"),
+            units="1",
+            data=self.depolarisation,
+            dtype="f4",
+            mask=self.mask_depolarisation,
+        )
+        nc.add_variable(
+            name="depolarisation",
+            dimensions=("time", "range"),
+            units="1",
+            data=self.depolarisation,
+            dtype="f4",
+            mask=self.mask_beta | self.mask_depolarisation,
+        )
+        nc.add_variable(
+            name="beta_cross_raw",
+            dimensions=("time", "range"),
+            units="sr-1 m-1",
+            data=self.beta_cross,
+            mask=self.mask_beta_cross,
+            dtype="f4",
+        )
+        nc.add_variable(
+            name="beta_cross",
+            dimensions=("time", "range"),
+            units="sr-1 m-1",
+            data=self.beta_cross,
+            mask=self.mask_beta | self.mask_beta_cross,
+            dtype="f4",
+        )
+        nc.add_scalar_variable(
+            name="polariser_bleed_through",
+            units="1",
+            long_name="Polariser bleed-through",
+            data=self.polariser_bleed_through,
+            dtype="f4",
+        )
+        match self.ray_info:
+            case RayAccumulationTime(value):
+                nc.add_scalar_variable(
+                    name="ray_accumulation_time",
+                    units="s",
+                    long_name="ray accumulation time",
+                    data=value,
+                    dtype="f4",
+                )
+            case PulsesPerRay(value):
+                nc.add_scalar_variable(
+                    name="pulses_per_ray",
+                    units="1",
+                    long_name="pulses per ray",
+                    data=value,
+                    dtype="u4",
+                )
+        nc.add_attribute("serial_number", self.system_id)
+        nc.add_attribute("doppy_version", doppy.__version__)
+
+
+def _co_and_cross_stares(
+    executor: options.Executor,
+    func: Callable[..., Stare],
+    co_args: tuple[Any, ...],
+    cross_args: tuple[Any, ...],
+    common_args: tuple[Any, ...],
+) -> tuple[Stare, Stare]:
+    match executor:
+        case options.Executor.SERIAL:
+            return func(*co_args, *common_args), func(*cross_args, *common_args)
+        case options.Executor.THREAD | options.Executor.PROCESS:
+            with _pool_executor(executor, max_workers=2) as pool:
+                co_future = pool.submit(func, *co_args, *common_args)
+                cross_future = pool.submit(func, *cross_args, *common_args)
+                return co_future.result(), cross_future.result()
+
+
+def _pool_executor(executor: options.Executor, max_workers: int) -> Executor:
+    match executor:
+        case options.Executor.THREAD:
+            return ThreadPoolExecutor(max_workers=max_workers)
+        case options.Executor.PROCESS:
+            # Forking is not safe once threads (e.g. BLAS or OpenMP) are running
+            return ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
             )
-            match self.ray_info:
-                case RayAccumulationTime(value):
-                    nc.add_scalar_variable(
-                        name="ray_accumulation_time",
-                        units="s",
-                        long_name="ray accumulation time",
-                        data=value,
-                        dtype="f4",
-                    )
-                case PulsesPerRay(value):
-                    nc.add_scalar_variable(
-                        name="pulses_per_ray",
-                        units="1",
-                        long_name="pulses per ray",
-                        data=value,
-                        dtype="u4",
-                    )
-            nc.add_attribute("serial_number", self.system_id)
-            nc.add_attribute("doppy_version", doppy.__version__)
+    raise ValueError(f"No pool executor for {executor}")
+
+
+def _stare_from_halo_data(
+    data: Sequence[str] | Sequence[Path] | Sequence[bytes] | Sequence[BufferedIOBase],
+    data_bg: Sequence[str]
+    | Sequence[Path]
+    | Sequence[tuple[bytes, str]]
+    | Sequence[tuple[BufferedIOBase, str]],
+    bg_correction_method: options.BgCorrectionMethod,
+    noise_mask_method: options.NoiseMaskMethod,
+    bg_parser: _BackgroundParser | None,
+    bg_fit_cache: _BackgroundFitCache | None,
+    dtype: npt.DTypeLike = np.float64,
+) -> Stare:
+    return Stare._from_halo_raws(
+        doppy.raw.HaloHpl.from_srcs(data),
+        _relevant_background_parser(data_bg, bg_parser),
+        bg_correction_method=bg_correction_method,
+        noise_mask_method=noise_mask_method,
+        bg_fit_cache=bg_fit_cache,
+        dtype=dtype,
+    )
+
+
+def _stare_from_halo_raw(
+    raws: Sequence[doppy.raw.HaloHpl],
+    bgs: Sequence[doppy.raw.HaloBg],
+    bg_correction_method: options.BgCorrectionMethod,
+    noise_mask_method: options.NoiseMaskMethod,
+    bg_fit_cache: _BackgroundFitCache | None,
+    dtype: npt.DTypeLike = np.float64,
+) -> Stare:
+    return Stare._from_halo_raws(
+        raws,
+        lambda time, ngates: bgs,
+        bg_correction_method=bg_correction_method,
+        noise_mask_method=noise_mask_method,
+        bg_fit_cache=bg_fit_cache,
+        dtype=dtype,
+    )
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import functools
+from io import BufferedIOBase
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+import doppy
+from doppy import defaults, options
+from doppy.product.noise_utils import detect_wind_noise
+from doppy.product.stare import (
+    PulsesPerRay,
+    Stare,
+    _BackgroundParser,
+    _compute_beta,
+    _compute_noise_mask,
+    _correct_background,
+    _correct_intensity_noise_bias,
+    _merge_backgrounds_for_stare,
+    _merge_raws_for_stare,
+    _parse_relevant_backgrounds,
+    _select_raws_for_stare,
+)
+
+
+class StarePipeline:
+    """
+    HALO stare processing as explicit stages whose results are kept:
+
+        raw -> background -> background_corrected -> intensity -> beta
+                                                               -> mask_beta
+                                                               -> mask_radial_velocity
+
+    Changing an option recomputes only the stages that depend on it, which
+    makes it cheap to compare options on the same data.
+
+    Examples
+    --------
+    >>> pipeline = StarePipeline(hpl_files, bg_files)
+    >>> default = pipeline.stare
+    >>> pipeline.noise_mask_method = options.NoiseMaskMethod.INTENSITY_ONLY
+    >>> intensity_only = pipeline.stare  # only the masks are recomputed
+    """
+
+    # Stages that have to be recomputed when an option changes, in order
+    _STAGES_AFTER_BG_CORRECTION_METHOD = (
+        "background_corrected",
+        "intensity",
+        "beta",
+        "mask_beta",
+        "mask_radial_velocity",
+    )
+    _STAGES_AFTER_NOISE_MASK_METHOD = ("mask_beta", "mask_radial_velocity")
+
+    def __init__(
+        self,
+        data: Sequence[str]
+        | Sequence[Path]
+        | Sequence[bytes]
+        | Sequence[BufferedIOBase],
+        data_bg: Sequence[str]
+        | Sequence[Path]
+        | Sequence[tuple[bytes, str]]
+        | Sequence[tuple[BufferedIOBase, str]],
+        bg_correction_method: options.BgCorrectionMethod = (
+            options.BgCorrectionMethod.FIT
+        ),
+        noise_mask_method: options.NoiseMaskMethod = (
+            options.NoiseMaskMethod.INTENSITY_AND_VELOCITY
+        ),
+        workers: int = 1,
+    ) -> None:
+        self._data = data
+        self._data_bg = data_bg
+        self._bg_correction_method = bg_correction_method
+        self._noise_mask_method = noise_mask_method
+        self.workers = workers
+
+    @property
+    def bg_correction_method(self) -> options.BgCorrectionMethod:
+        return self._bg_correction_method
+
+    @bg_correction_method.setter
+    def bg_correction_method(self, value: options.BgCorrectionMethod) -> None:
+        if value != self._bg_correction_method:
+            self._bg_correction_method = value
+            self._invalidate(self._STAGES_AFTER_BG_CORRECTION_METHOD)
+
+    @property
+    def noise_mask_method(self) -> options.NoiseMaskMethod:
+        return self._noise_mask_method
+
+    @noise_mask_method.setter
+    def noise_mask_method(self, value: options.NoiseMaskMethod) -> None:
+        if value != self._noise_mask_method:
+            self._noise_mask_method = value
+            self._invalidate(self._STAGES_AFTER_NOISE_MASK_METHOD)
+
+    def _invalidate(self, stages: Sequence[str]) -> None:
+        for stage in stages:
+            self.__dict__.pop(stage, None)
+
+    @functools.cached_property
+    def raw(self) -> doppy.raw.HaloHpl:
+        """Merged profiles of the most common vertical stare configuration"""
+        raws = doppy.raw.HaloHpl.from_srcs(self._data)
+        if len(raws) == 0:
+            raise doppy.exceptions.NoDataError("HaloHpl data missing")
+        return _merge_raws_for_stare(_select_raws_for_stare(raws))
+
+    @functools.cached_property
+    def background(self) -> doppy.raw.HaloBg:
+        """Merged background profiles"""
+        bgs = _parse_relevant_backgrounds(
+            self._data_bg, self.raw.time, self.raw.header.ngates, _BackgroundParser()
+        )
+        return _merge_backgrounds_for_stare(bgs, self.raw.header.ngates)
+
+    @functools.cached_property
+    def background_corrected(
+        self,
+    ) -> tuple[doppy.raw.HaloHpl, npt.NDArray[np.float64]]:
+        """Profiles with a background measurement and their corrected intensity"""
+        raw, intensity_bg_corrected = _correct_background(
+            self.raw, self.background, self.bg_correction_method
+        )
+        if len(raw.time) == 0:
+            raise doppy.exceptions.NoDataError("No matching data and bg files")
+        return raw, intensity_bg_corrected
+
+    @functools.cached_property
+    def intensity(self) -> npt.NDArray[np.float64]:
+        """Background and noise bias corrected intensity"""
+        raw, intensity_bg_corrected = self.background_corrected
+        return _correct_intensity_noise_bias(raw, intensity_bg_corrected, self.workers)
+
+    @functools.cached_property
+    def beta(self) -> npt.NDArray[np.float64]:
+        raw, _ = self.background_corrected
+        return _compute_beta(
+            snr=self.intensity - 1,
+            radial_distance=raw.radial_distance,
+            wavelength=defaults.Halo.wavelength,
+            beam_energy=defaults.Halo.beam_energy,
+            receiver_bandwidth=defaults.Halo.receiver_bandwidth,
+            focus=raw.header.focus_range,
+            effective_diameter=defaults.Halo.effective_diameter,
+        )
+
+    @functools.cached_property
+    def mask_beta(self) -> npt.NDArray[np.bool_]:
+        raw, _ = self.background_corrected
+        return _compute_noise_mask(
+            self.intensity,
+            raw.radial_velocity,
+            raw.radial_distance,
+            self.noise_mask_method,
+            self.workers,
+        )
+
+    @functools.cached_property
+    def mask_radial_velocity(self) -> npt.NDArray[np.bool_]:
+        raw, _ = self.background_corrected
+        match self.noise_mask_method:
+            case options.NoiseMaskMethod.INTENSITY_AND_VELOCITY:
+                return detect_wind_noise(
+                    raw.radial_velocity, raw.radial_distance, self.mask_beta
+                )
+            case options.NoiseMaskMethod.INTENSITY_ONLY:
+                return self.mask_beta.copy()
+
+    @property
+    def stare(self) -> Stare:
+        """Stare product with the current options"""
+        raw, _ = self.background_corrected
+        return Stare(
+            time=raw.time,
+            radial_distance=raw.radial_distance,
+            elevation=raw.elevation,
+            beta=self.beta,
+            snr=self.intensity - 1,
+            radial_velocity=raw.radial_velocity,
+            mask_beta=self.mask_beta,
+            mask_radial_velocity=self.mask_radial_velocity,
+            wavelength=defaults.Halo.wavelength,
+            system_id=raw.header.system_id,
+            ray_info=PulsesPerRay(raw.header.pulses_per_ray),
+        )
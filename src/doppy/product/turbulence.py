@@ -1,10 +1,22 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from typing import Iterator, Sequence, TypeVar
 
 import numpy as np
 import numpy.typing as npt
-from scipy.interpolate import RegularGridInterpolator
+
+from doppy.product import tiling
+from doppy.product.stare import PulsesPerRay, RayAccumulationTime, Stare
+from doppy.product.utils import compute_dtype
+from doppy.product.wind import Wind
+
+# Not given in the HPL files, assumed to be the same for all HALO lidars
+_HALO_PULSE_REPETITION_FREQUENCY = 15e3  # [Hz]
+
+_SummableArray = TypeVar(
+    "_SummableArray", npt.NDArray[np.float64], npt.NDArray[np.int64]
+)
 
 
 @dataclass
@@ -24,7 +36,10 @@ class VerticalWind:
 
 @dataclass
 class Options:
-    ray_accumulation_time: float  # in seconds
+    # in seconds. If None, from_stare_and_wind takes it from the stare
+    # product. For HALO stares, which give the number of pulses per ray, it
+    # is computed assuming a pulse repetition frequency of 15 kHz.
+    ray_accumulation_time: float | None = None
     period: float = 600  # period for computing the variance in seconds
     beam_divergence: float = 33e-6  # radians
 
@@ -38,23 +53,203 @@ class Turbulence:
 
     @classmethod
     def from_winds(
-        cls, vert: VerticalWind, hori: HorizontalWind, options: Options
+        cls,
+        vert: VerticalWind,
+        hori: HorizontalWind,
+        options: Options,
+        dtype: npt.DTypeLike = np.float64,
+        workers: int = 1,
     ) -> Turbulence:
-        V = _preprocess_horiontal_wind(vert, hori, options)
-        ls_low = _length_scale_low(V, vert.height, options)
-        res = _compute_variance(vert, options.period)
-        sampling_time = _sampling_time_in_seconds(res)
-        ls_up = V * sampling_time
-        dissipation_rate = _compute_dissipation_rate(res.variance, ls_low, ls_up)
-        mask = np.isnan(dissipation_rate) | vert.mask
+        """
+        Parameters
+        ----------
+        dtype
+            floating point type, np.float32 or np.float64, of the dissipation
+            rate and the length scales. The interpolation, rolling mean and
+            variance accumulate sums and are always computed in float64.
+        workers
+            number of threads. The height gates are split into this many
+            blocks that are processed independently.
+        """
+        (turbulence,) = cls.from_winds_for_periods(
+            vert, hori, options, [options.period], dtype, workers
+        )
+        return turbulence
+
+    @classmethod
+    def from_winds_for_periods(
+        cls,
+        vert: VerticalWind,
+        hori: HorizontalWind,
+        options: Options,
+        periods: Sequence[float],
+        dtype: npt.DTypeLike = np.float64,
+        workers: int = 1,
+    ) -> list[Turbulence]:
+        """
+        Same as from_winds for each variance period in periods, in seconds.
+        options.period is not used.
+
+        The interpolated horizontal wind, the cumulative sums and the
+        valid-index arrays are computed once and shared by all periods.
+        """
+        return [
+            cls(
+                time=vert.time.copy(),
+                height=vert.height.copy(),
+                turbulent_kinetic_energy_dissipation_rate=dissipation_rate,
+                mask=mask,
+            )
+            for dissipation_rate, mask in _compute_turbulence(
+                vert, hori, options, periods, compute_dtype(dtype), workers
+            )
+        ]
+
+    @classmethod
+    def from_stare_and_wind(
+        cls,
+        stare: Stare,
+        wind: Wind,
+        options: Options | None = None,
+        dtype: npt.DTypeLike = np.float64,
+        workers: int = 1,
+    ) -> Turbulence:
+        """
+        Same as from_winds with the vertical wind from the radial velocity of
+        a vertical stare and the horizontal wind speed from a wind product.
+
+        The time, height, radial velocity and mask arrays are shared with
+        stare, not copied. The horizontal wind speed is computed only for the
+        wind profiles needed to interpolate it to the stare times.
+
+        If options.ray_accumulation_time is None, it is taken from
+        stare.ray_info. HALO stares give the number of pulses per ray, and the
+        ray accumulation time is then computed assuming a pulse repetition
+        frequency of 15 kHz. Give options.ray_accumulation_time explicitly for
+        instruments with a different pulse repetition frequency.
+        """
+        options = options if options is not None else Options()
+        if options.ray_accumulation_time is None:
+            options = replace(
+                options, ray_accumulation_time=_ray_accumulation_time(stare)
+            )
+        vert = VerticalWind(
+            time=stare.time,
+            height=stare.radial_distance,
+            w=stare.radial_velocity,
+            mask=stare.mask_radial_velocity,
+        )
+        ((dissipation_rate, mask),) = _compute_turbulence(
+            vert,
+            _horizontal_wind_for_times(wind, stare.time),
+            options,
+            [options.period],
+            compute_dtype(dtype),
+            workers,
+        )
         return cls(
-            time=vert.time.copy(),
-            height=vert.height.copy(),
+            time=stare.time,
+            height=stare.radial_distance,
             turbulent_kinetic_energy_dissipation_rate=dissipation_rate,
             mask=mask,
         )
 
 
+def _ray_accumulation_time(stare: Stare) -> float:
+    match stare.ray_info:
+        case RayAccumulationTime(value):
+            return float(value)
+        case PulsesPerRay(value):
+            return value / _HALO_PULSE_REPETITION_FREQUENCY
+    raise TypeError(f"Unexpected ray info {stare.ray_info}")
+
+
+def _horizontal_wind_for_times(
+    wind: Wind, time: npt.NDArray[np.datetime64]
+) -> HorizontalWind:
+    """
+    Horizontal wind speed of the wind profiles that interpolation to time
+    uses: the profiles within time and the nearest profile on each side
+    """
+    n = len(wind.time)
+    if len(time) == 0 or n < 2:
+        start, stop = 0, n
+    else:
+        start = max(int(np.searchsorted(wind.time, time[0], side="right")) - 1, 0)
+        stop = min(int(np.searchsorted(wind.time, time[-1], side="left")), n - 1) + 1
+        # Linear interpolation needs at least two profiles
+        start = min(start, n - 2)
+        stop = max(stop, start + 2)
+    zonal_wind = wind.zonal_wind[start:stop]
+    meridional_wind = wind.meridional_wind[start:stop]
+    return HorizontalWind(
+        time=wind.time[start:stop],
+        height=wind.height,
+        V=np.sqrt(zonal_wind**2 + meridional_wind**2),
+    )
+
+
+def _compute_turbulence(
+    vert: VerticalWind,
+    hori: HorizontalWind,
+    options: Options,
+    periods: Sequence[float],
+    dtype: np.dtype,
+    workers: int,
+) -> list[tuple[npt.NDArray[np.float64], npt.NDArray[np.bool_]]]:
+    """
+    Returns the dissipation rate and its mask for each period
+    """
+    if options.ray_accumulation_time is None:
+        raise ValueError("options.ray_accumulation_time is required")
+    if np.isnan(hori.V).any():
+        raise ValueError("horizontal wind speed cannot contains NaNs")
+    dissipation_rates = [np.empty(vert.w.shape, dtype=dtype) for _ in periods]
+
+    def run(start: int, stop: int) -> None:
+        block = VerticalWind(
+            time=vert.time,
+            height=vert.height[start:stop],
+            w=vert.w[:, start:stop],
+            mask=vert.mask[:, start:stop],
+        )
+        for out, dissipation_rate in zip(
+            dissipation_rates,
+            _dissipation_rates(block, hori, options, periods, dtype),
+        ):
+            out[:, start:stop] = dissipation_rate
+
+    tiling.run_in_blocks(run, len(vert.height), workers)
+    return [
+        (dissipation_rate, np.isnan(dissipation_rate) | vert.mask)
+        for dissipation_rate in dissipation_rates
+    ]
+
+
+def _dissipation_rates(
+    vert: VerticalWind,
+    hori: HorizontalWind,
+    options: Options,
+    periods: Sequence[float],
+    dtype: np.dtype,
+) -> Iterator[npt.NDArray[np.float64]]:
+    """
+    Dissipation rate for each period. Every height gate is computed
+    independently of the others.
+    """
+    horizontal_wind = _RollingMean(vert.time, _interpolate_horizontal_wind(vert, hori))
+    variance = _WindowedVariance(vert)
+    for period in periods:
+        V = horizontal_wind.mean(period).astype(dtype, copy=False)
+        ls_low = _length_scale_low(V, vert.height, options)
+        res = variance.result(period)
+        sampling_time = _sampling_time_in_seconds(res).astype(dtype, copy=False)
+        ls_up = V * sampling_time
+        yield _compute_dissipation_rate(
+            res.variance.astype(dtype, copy=False), ls_low, ls_up
+        )
+
+
 def _sampling_time_in_seconds(r: VarResult) -> npt.NDArray[np.float64]:
     if not all(
         (
@@ -76,131 +271,237 @@ class VarResult:
     nsamples: npt.NDArray[np.int64]
 
 
-def _compute_variance(vert: VerticalWind, period: float) -> VarResult:
-    # NOTE: numerically unstable
-
-    # To compute actual time window
-    next_valid = _next_valid_from_mask(vert.mask)
-    prev_valid = _prev_valid_from_mask(vert.mask)
-
-    X = vert.w.copy()
-    X[vert.mask] = 0
-    X2 = X**2
-    X_cumsum = X.cumsum(axis=0)
-    X2_cumsum = X2.cumsum(axis=0)
-
-    N_i = (~vert.mask).astype(int)
-    N_cumsum = N_i.cumsum(axis=0)
-
-    def N_func(i: int, j: int) -> npt.NDArray[np.float64]:
-        return np.array(N_cumsum[j] - N_cumsum[i] + N_i[i], dtype=np.float64)
-
-    def S(i: int, j: int) -> npt.NDArray[np.float64]:
-        return np.array(X_cumsum[j] - X_cumsum[i] + X[i], dtype=np.float64)
-
-    def S2(i: int, j: int) -> npt.NDArray[np.float64]:
-        return np.array(X2_cumsum[j] - X2_cumsum[i] + X2[i], dtype=np.float64)
-
-    def var_ij(i: int, j: int) -> npt.NDArray[np.float64]:
-        N = N_func(i, j)
-        with np.errstate(invalid="ignore"):
-            return np.array((S2(i, j) - S(i, j) ** 2 / N) / N, dtype=np.float64)
-
-    half_period = np.timedelta64(int(1e6 * period / 2), "us")
-    period_start = np.full(vert.w.shape, np.datetime64("NaT", "us"))
-    period_stop = np.full(vert.w.shape, np.datetime64("NaT", "us"))
-    var = np.full(vert.w.shape, np.nan, dtype=np.float64)
-    nsamples = np.zeros_like(vert.w, dtype=np.int64)
-    i = 0
-    j = 0
-    n = len(vert.time)
-    for k, t in enumerate(vert.time):
-        while i + 1 < n and t - vert.time[i + 1] >= half_period:
-            i += 1
-        while j + 1 < n and vert.time[j] - t < half_period:
-            j += 1
-        i_valid = next_valid[i]
-        i_inbound = (0 <= i_valid) & (i_valid < n)
-        j_valid = prev_valid[j]
-        j_inbound = (0 <= j_valid) & (j_valid < n)
-        period_start[k][i_inbound] = vert.time[i_valid[i_inbound]]
-        period_stop[k][j_inbound] = vert.time[j_valid[j_inbound]]
-        var[k] = var_ij(i, j)
-        nsamples[k] = N_func(i, j)
-    return VarResult(
-        variance=var,
-        period_start=period_start,
-        period_stop=period_stop,
-        nsamples=nsamples,
+class _WindowedVariance:
+    """
+    Variance of w over a window of length period centered at each time step,
+    using only the unmasked values.
+
+    The window sums are differences of cumulative sums, which are computed
+    once and shared by all periods. The values are shifted by the mean of
+    their height gate before summing, which does not change the variance but
+    avoids the cancellation of the sum of squares formula when the mean is
+    large compared to the deviations.
+    """
+
+    def __init__(self, vert: VerticalWind) -> None:
+        self.time = vert.time
+        valid = ~vert.mask
+        self.N_cumsum = _cumsum_with_zero_row(valid.astype(np.int64))
+        X = np.where(valid, vert.w, 0).astype(np.float64, copy=False)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shift = X.sum(axis=0) / valid.sum(axis=0)
+        shift[~np.isfinite(shift)] = 0
+        X = np.where(valid, X - shift, 0)
+        self.X_cumsum = _cumsum_with_zero_row(X)
+        np.square(X, out=X)
+        self.X2_cumsum = _cumsum_with_zero_row(X)
+        del X
+        self.next_valid = _next_valid_from_mask(vert.mask)
+        self.prev_valid = _prev_valid_from_mask(vert.mask)
+        # Index n and -1, i.e. no valid value, both map to NaT
+        self.time_or_nat = np.append(
+            vert.time.astype("datetime64[us]"), np.datetime64("NaT", "us")
+        )
+
+    def result(self, period: float) -> VarResult:
+        half_period = np.timedelta64(int(1e6 * period / 2), "us")
+        start, stop = _window_bounds(self.time, half_period)
+        N = _window_sum(self.N_cumsum, start, stop)
+        S = _window_sum(self.X_cumsum, start, stop)
+        S2 = _window_sum(self.X2_cumsum, start, stop)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            var = np.square(S, out=S)
+            var /= N
+            np.subtract(S2, var, out=var)
+            var /= N
+        # Rounding can leave the variance of nearly constant values slightly
+        # negative
+        np.maximum(var, 0, out=var)
+        return VarResult(
+            variance=var,
+            period_start=self.time_or_nat[self.next_valid[start]],
+            period_stop=self.time_or_nat[self.prev_valid[stop]],
+            nsamples=N,
+        )
+
+
+def _window_bounds(
+    time: npt.NDArray[np.datetime64], half_period: np.timedelta64
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """
+    Returns the first and last index, inclusive, of the window around each
+    time step: the last time step at most half_period before it and the
+    first time step at least half_period after it, clipped to the array.
+    time must be sorted.
+    """
+    n = len(time)
+    start = np.searchsorted(time, time - half_period, side="right") - 1
+    stop = np.searchsorted(time, time + half_period, side="left")
+    return (
+        np.clip(start, 0, None).astype(np.int64),
+        np.clip(stop, None, n - 1).astype(np.int64),
     )
 
 
+def _cumsum_with_zero_row(arr: _SummableArray) -> _SummableArray:
+    cumsum = np.zeros((arr.shape[0] + 1, *arr.shape[1:]), dtype=arr.dtype)
+    np.cumsum(arr, axis=0, out=cumsum[1:])
+    return cumsum
+
+
+def _window_sum(
+    cumsum: _SummableArray, start: npt.NDArray[np.int64], stop: npt.NDArray[np.int64]
+) -> _SummableArray:
+    """
+    Sums of arr[start[k] : stop[k] + 1] along the first axis, where cumsum
+    is _cumsum_with_zero_row(arr)
+    """
+    window_sum = cumsum[stop + 1]
+    window_sum -= cumsum[start]
+    return window_sum
+
+
 def _length_scale_low(
     V: npt.NDArray[np.float64], height: npt.NDArray[np.float64], opts: Options
 ) -> npt.NDArray[np.float64]:
     integration_time = opts.ray_accumulation_time
-    from_beam = 2 * height * np.sin(opts.beam_divergence / 2)
+    if integration_time is None:
+        raise ValueError("options.ray_accumulation_time is required")
+    from_beam = (2 * height * np.sin(opts.beam_divergence / 2)).astype(
+        V.dtype, copy=False
+    )
     from_wind = V * integration_time
-    return np.array(from_wind + from_beam[np.newaxis, :], dtype=np.float64)
+    return np.array(from_wind + from_beam[np.newaxis, :], dtype=V.dtype)
 
 
-def _preprocess_horiontal_wind(
-    vert: VerticalWind, hori: HorizontalWind, options: Options
+def _interpolate_horizontal_wind(
+    vert: VerticalWind, hori: HorizontalWind
 ) -> npt.NDArray[np.float64]:
     if np.isnan(hori.V).any():
         raise ValueError("horizontal wind speed cannot contains NaNs")
-    trg_points = np.meshgrid(vert.time, vert.height, indexing="ij")
-    src_points = (hori.time, hori.height)
-    src_vals = hori.V
-
-    interp_nearest = RegularGridInterpolator(
-        src_points,
-        src_vals,
-        method="nearest",
-        bounds_error=False,
-        fill_value=None,
-    )
-    interp_linear = RegularGridInterpolator(
-        src_points, src_vals, method="linear", bounds_error=False
+    V = _interpolate_to_grid(
+        _time_in_us(hori.time),
+        hori.height,
+        np.asarray(hori.V, dtype=np.float64),
+        _time_in_us(vert.time),
+        vert.height,
     )
-    V_nearest = interp_nearest(trg_points)
-    V_linear = interp_linear(trg_points)
-    V = V_linear
-    V[np.isnan(V)] = V_nearest[np.isnan(V)]
     if np.isnan(V).any():
         raise ValueError("Unexpected NaNs")
-    V_rmean = _rolling_mean_over_time(vert.time, V, options.period)
-    return V_rmean
+    return V
+
+
+# Number of time steps processed at once when a step needs temporary arrays
+_BLOCK_SIZE = 1024
 
 
-def _rolling_mean_over_time(
-    time: npt.NDArray[np.datetime64], arr: npt.NDArray[np.float64], period: float
+def _interpolate_to_grid(
+    src_time: npt.NDArray[np.float64],
+    src_height: npt.NDArray[np.float64],
+    src_vals: npt.NDArray[np.float64],
+    trg_time: npt.NDArray[np.float64],
+    trg_height: npt.NDArray[np.float64],
 ) -> npt.NDArray[np.float64]:
-    if arr.ndim != 2:
-        raise ValueError("number of dims on arr should be 2")
-    if time.ndim != 1 or time.shape[0] != arr.shape[0]:
-        raise ValueError("time and arr dimensions do not match")
-    if time.dtype != np.dtype("datetime64[us]"):
-        raise TypeError(f"Invalid time type: {time.dtype}")
+    """
+    Same as scipy.interpolate.RegularGridInterpolator((src_time, src_height),
+    src_vals) evaluated with the linear method at all (trg_time, trg_height)
+    points, and with the nearest method at points outside of the source grid.
+
+    The grid is rectilinear, so the indices and weights are found separately
+    for each axis and combined by broadcasting, one block of time steps at a
+    time, without forming the (time, height) arrays of target points.
+    """
+    t_index, t_weight, t_inside, t_nearest = _axis_weights(src_time, trg_time)
+    h_index, h_weight, h_inside, h_nearest = _axis_weights(src_height, trg_height)
+    h_weight_complement = 1 - h_weight
+
+    V = np.empty((len(trg_time), len(trg_height)), dtype=np.float64)
+    for start in range(0, len(trg_time), _BLOCK_SIZE):
+        rows = slice(start, start + _BLOCK_SIZE)
+        i = t_index[rows, np.newaxis]
+        y = t_weight[rows, np.newaxis]
+        y_complement = 1 - y
+        V[rows] = (
+            src_vals[i, h_index] * y_complement * h_weight_complement
+            + src_vals[i, h_index + 1] * y_complement * h_weight
+            + src_vals[i + 1, h_index] * y * h_weight_complement
+            + src_vals[i + 1, h_index + 1] * y * h_weight
+        )
+    if not t_inside.all():
+        V[~t_inside] = src_vals[np.ix_(t_nearest[~t_inside], h_nearest)]
+    if not h_inside.all():
+        V[:, ~h_inside] = src_vals[np.ix_(t_nearest, h_nearest[~h_inside])]
+    return V
+
+
+def _axis_weights(
+    grid: npt.NDArray[np.float64], x: npt.NDArray[np.float64]
+) -> tuple[
+    npt.NDArray[np.int64],
+    npt.NDArray[np.float64],
+    npt.NDArray[np.bool_],
+    npt.NDArray[np.int64],
+]:
+    """
+    Returns
+    -------
+    index
+        i such that grid[i] <= x < grid[i + 1], clipped to the grid
+    weight
+        linear interpolation weight of grid[i + 1]
+    inside
+        True iff x is within the grid
+    nearest
+        index of the nearest grid point, ties to the lower one
+    """
+    if len(grid) < 2:
+        raise ValueError("At least 2 points are needed for linear interpolation")
+    index = np.clip(np.searchsorted(grid, x, side="right") - 1, 0, len(grid) - 2)
+    weight = (x - grid[index]) / (grid[index + 1] - grid[index])
+    inside = (grid[0] <= x) & (x <= grid[-1])
+    nearest = np.where(weight <= 0.5, index, index + 1)
+    return (
+        index.astype(np.int64),
+        np.asarray(weight, dtype=np.float64),
+        np.asarray(inside, dtype=np.bool_),
+        nearest.astype(np.int64),
+    )
 
-    S = arr.cumsum(axis=0)
 
-    def rolling_mean(i: int, j: int) -> npt.NDArray[np.float64]:
-        return np.array((S[j] - S[i] + arr[i]) / (j - i + 1), dtype=np.float64)
+def _time_in_us(time: npt.NDArray[np.datetime64]) -> npt.NDArray[np.float64]:
+    return time.astype("datetime64[us]").astype(np.float64)
 
-    half_period = np.timedelta64(int(period * 0.5e6), "us")
-    rol_mean = np.full(arr.shape, np.nan, dtype=np.float64)
 
-    i = 0
-    j = 0
-    n = len(time)
-    for k, t in enumerate(time):
-        while i + 1 < n and t - time[i + 1] >= half_period:
-            i += 1
-        while j + 1 < n and time[j] - t < half_period:
-            j += 1
-        rol_mean[k] = rolling_mean(i, j)
-    return rol_mean
+class _RollingMean:
+    """
+    Mean of arr over a window of length period centered at each time step.
+    The cumulative sum is computed once and shared by all periods.
+    """
+
+    def __init__(
+        self, time: npt.NDArray[np.datetime64], arr: npt.NDArray[np.float64]
+    ) -> None:
+        if arr.ndim != 2:
+            raise ValueError("number of dims on arr should be 2")
+        if time.ndim != 1 or time.shape[0] != arr.shape[0]:
+            raise ValueError("time and arr dimensions do not match")
+        if time.dtype != np.dtype("datetime64[us]"):
+            raise TypeError(f"Invalid time type: {time.dtype}")
+        self.time = time
+        self.arr = arr
+        self.S = arr.cumsum(axis=0)
+
+    def mean(self, period: float) -> npt.NDArray[np.float64]:
+        half_period = np.timedelta64(int(period * 0.5e6), "us")
+        start, stop = _window_bounds(self.time, half_period)
+        rol_mean = np.empty(self.arr.shape, dtype=np.float64)
+        for block_start in range(0, len(self.time), _BLOCK_SIZE):
+            rows = slice(block_start, block_start + _BLOCK_SIZE)
+            i = start[rows]
+            j = stop[rows]
+            count = (j - i + 1)[:, np.newaxis]
+            rol_mean[rows] = (self.S[j] - self.S[i] + self.arr[i]) / count
+        return rol_mean
 
 
 def _compute_dissipation_rate(
@@ -224,7 +525,7 @@ def _compute_dissipation_rate(
             * (length_scale_upper ** (2 / 3) - length_scale_lower ** (2 / 3))
             ** (-3 / 2)
         )
-    return np.array(dr, dtype=np.float64)
+    return np.array(dr, dtype=variance.dtype)
 
 
 def _next_valid_from_mask(mask: npt.NDArray[np.bool_]) -> npt.NDArray[np.int64]:
@@ -235,15 +536,11 @@ def _next_valid_from_mask(mask: npt.NDArray[np.bool_]) -> npt.NDArray[np.int64]:
     if the set is non empty and N[t,v] = len(mask) otherwise
     """
     n = len(mask)
-    N = np.full(mask.shape, n)
+    N = np.where(mask, n, np.arange(n)[:, np.newaxis]).astype(np.int64)
     if mask.size == 0:
         return N
-    N[-1][~mask[-1]] = n - 1
-
-    for t in reversed(range(n - 1)):
-        N[t][~mask[t]] = t
-        N[t][mask[t]] = N[t + 1][mask[t]]
-    return np.array(N, dtype=np.int64)
+    np.minimum.accumulate(N[::-1], axis=0, out=N[::-1])
+    return N
 
 
 def _prev_valid_from_mask(mask: npt.NDArray[np.bool_]) -> npt.NDArray[np.int64]:
@@ -254,11 +551,8 @@ def _prev_valid_from_mask(mask: npt.NDArray[np.bool_]) -> npt.NDArray[np.int64]:
     if the set is non empty and N[t,v] = -1 otherwise
     """
     n = len(mask)
-    N = np.full(mask.shape, -1)
+    N = np.where(mask, -1, np.arange(n)[:, np.newaxis]).astype(np.int64)
     if mask.size == 0:
         return N
-    N[0][~mask[0]] = 0
-    for t in range(1, n):
-        N[t][~mask[t]] = t
-        N[t][mask[t]] = N[t - 1][mask[t]]
-    return np.array(N, dtype=np.int64)
+    np.maximum.accumulate(N, axis=0, out=N)
+    return N
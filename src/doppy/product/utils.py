@@ -1,6 +1,14 @@
+from typing import Any
+
 import numpy as np
 import numpy.typing as npt
 
 
-def arr_to_rounded_set(arr: npt.NDArray[np.float64]) -> set[int]:
-    return set(int(x) for x in np.round(arr))
+def compute_dtype(dtype: npt.DTypeLike) -> np.dtype[np.floating[Any]]:
+    """
+    Validates the floating point type that a product is computed in
+    """
+    dtype_ = np.dtype(dtype)
+    if dtype_ != np.float32 and dtype_ != np.float64:
+        raise ValueError(f"dtype must be float32 or float64, not {dtype_}")
+    return dtype_  # type: ignore[return-value]
@@ -1,18 +1,25 @@
 from __future__ import annotations
 
 import functools
-from collections import Counter
+import os
+from collections import Counter, defaultdict
 from dataclasses import dataclass
 from io import BufferedIOBase
 from pathlib import Path
-from typing import Sequence
+from typing import BinaryIO, Mapping, Sequence
 
 import numpy as np
 import numpy.typing as npt
-from scipy.ndimage import generic_filter
 
 import doppy
-from doppy.product.utils import arr_to_rounded_set
+from doppy.product.utils import compute_dtype
+from doppy.scan_segmentation import (
+    count_distinct_per_label,
+    group_scans_by_azimuth_rotation,
+    labels_by_first_appearance,
+    round_angles,
+    wrap_and_round_angles,
+)
 
 
 @dataclass
@@ -61,61 +68,79 @@ class Wind:
         | Sequence[bytes]
         | Sequence[BufferedIOBase],
         options: Options | None = None,
+        dtype: npt.DTypeLike = np.float64,
     ) -> Wind:
-        raws = doppy.raw.HaloHpl.from_srcs(data)
+        """
+        Parameters
+        ----------
+        dtype
+            floating point type, np.float32 or np.float64, of the wind
+            components and radial velocities. The wind fits are always
+            computed in float64.
+        """
+        return cls.from_halo_raw(doppy.raw.HaloHpl.from_srcs(data), options, dtype)
 
-        if len(raws) == 0:
-            raise doppy.exceptions.NoDataError("HaloHpl data missing")
-
-        raw = (
-            doppy.raw.HaloHpl.merge(_select_raws_for_wind(raws))
-            .sorted_by_time()
-            .non_strictly_increasing_timesteps_removed()
-            .nans_removed()
-        )
-        if len(raw.time) == 0:
-            raise doppy.exceptions.NoDataError("No suitable data for the wind product")
-
-        if options and options.azimuth_offset_deg:
-            raw.azimuth += options.azimuth_offset_deg
+    @classmethod
+    def from_halo_raw(
+        cls,
+        raws: Sequence[doppy.raw.HaloHpl],
+        options: Options | None = None,
+        dtype: npt.DTypeLike = np.float64,
+    ) -> Wind:
+        """
+        Same as from_halo_data but for parsed files
+        """
+        dtype = compute_dtype(dtype)
+        raw = _halo_raw_for_wind(raws, options, dtype)
+        return _wind_from_merged_halo_raw(raw, options, dtype)
 
-        groups = _group_scans_by_azimuth_rotation(raw)
-        time_list = []
-        elevation_list = []
-        wind_list = []
-        rmse_list = []
+    @classmethod
+    def all_from_halo_data(
+        cls,
+        data: Sequence[str]
+        | Sequence[Path]
+        | Sequence[bytes]
+        | Sequence[BufferedIOBase],
+        options: Options | None = None,
+        dtype: npt.DTypeLike = np.float64,
+    ) -> list[Wind]:
+        """
+        Wind products of all scan configurations in data, one for each
+        combination of HPL header and rounded elevation angle that has scans
+        with 1 < elevation angle < 85 and more than 3 azimuth angles.
+        from_halo_data returns only one of these.
+
+        The files are parsed once. Configurations for which no wind can be
+        computed are left out, and the products are in the order in which
+        their configurations first appear in data.
+        """
+        return cls.all_from_halo_raw(doppy.raw.HaloHpl.from_srcs(data), options, dtype)
 
-        for group_index in set(groups):
-            pick = group_index == groups
-            if pick.sum() < 4:
+    @classmethod
+    def all_from_halo_raw(
+        cls,
+        raws: Sequence[doppy.raw.HaloHpl],
+        options: Options | None = None,
+        dtype: npt.DTypeLike = np.float64,
+    ) -> list[Wind]:
+        """
+        Same as all_from_halo_data but for parsed files
+        """
+        dtype = compute_dtype(dtype)
+        if len(raws) == 0:
+            raise doppy.exceptions.NoDataError("HaloHpl data missing")
+        winds = []
+        for configuration_raws in _raws_by_configuration(raws).values():
+            try:
+                raw = _merge_raws_for_wind(configuration_raws, options, dtype)
+                winds.append(_wind_from_merged_halo_raw(raw, options, dtype))
+            except doppy.exceptions.NoDataError:
                 continue
-            time_, elevation_, wind_, rmse_ = _compute_wind(raw[pick])
-            time_list.append(time_)
-            elevation_list.append(elevation_)
-            wind_list.append(wind_[np.newaxis, :, :])
-            rmse_list.append(rmse_[np.newaxis, :])
-        time = np.array(time_list)
-        if len(time) == 0:
+        if len(winds) == 0:
             raise doppy.exceptions.NoDataError(
-                "Probably something wrong with scan grouping"
+                "No scan configuration suitable for the wind product"
             )
-        elevation = np.array(elevation_list)
-        wind = np.concatenate(wind_list)
-        rmse = np.concatenate(rmse_list)
-        if not np.allclose(elevation, elevation[0]):
-            raise ValueError("Elevation is expected to stay same")
-        height = raw.radial_distance * np.sin(np.deg2rad(elevation[0]))
-        mask = _compute_mask(wind, rmse)
-        return Wind(
-            time=time,
-            height=height,
-            zonal_wind=wind[:, :, 0],
-            meridional_wind=wind[:, :, 1],
-            vertical_wind=wind[:, :, 2],
-            mask=mask,
-            system_id=raw.header.system_id,
-            options=options,
-        )
+        return winds
 
     @classmethod
     def from_windcube_data(
@@ -125,14 +150,36 @@ class Wind:
         | Sequence[bytes]
         | Sequence[BufferedIOBase],
         options: Options | None = None,
+        dtype: npt.DTypeLike = np.float64,
     ) -> Wind:
-        raws = doppy.raw.WindCube.from_vad_or_dbs_srcs(data)
+        """
+        Parameters
+        ----------
+        dtype
+            floating point type, np.float32 or np.float64, of the wind
+            components and radial velocities. The wind fits are always
+            computed in float64.
+        """
+        return cls.from_windcube_raw(
+            doppy.raw.WindCube.from_vad_or_dbs_srcs(data), options, dtype
+        )
 
+    @classmethod
+    def from_windcube_raw(
+        cls,
+        raws: Sequence[doppy.raw.WindCube],
+        options: Options | None = None,
+        dtype: npt.DTypeLike = np.float64,
+    ) -> Wind:
+        """
+        Same as from_windcube_data but for parsed files
+        """
+        dtype = compute_dtype(dtype)
         if len(raws) == 0:
             raise doppy.exceptions.NoDataError("WindCube data missing")
 
         raw = (
-            doppy.raw.WindCube.merge(raws)
+            doppy.raw.WindCube.merge(list(raws))
             .sorted_by_time()
             .non_strictly_increasing_timesteps_removed()
             .reindex_scan_indices()
@@ -146,30 +193,15 @@ class Wind:
 
         if len(raw.time) == 0:
             raise doppy.exceptions.NoDataError("No suitable data for the wind product")
+        raw.radial_velocity = raw.radial_velocity.astype(dtype, copy=False)
 
         if options and options.azimuth_offset_deg:
             raw.azimuth += options.azimuth_offset_deg
 
-        time_list = []
-        elevation_list = []
-        wind_list = []
-        rmse_list = []
-
-        for scan_index in set(raw.scan_index):
-            pick = raw.scan_index == scan_index
-            if pick.sum() < 4:
-                continue
-            time_, elevation_, wind_, rmse_ = _compute_wind(raw[pick])
-            time_list.append(time_)
-            elevation_list.append(elevation_)
-            wind_list.append(wind_[np.newaxis, :, :])
-            rmse_list.append(rmse_[np.newaxis, :])
-
-        time = np.array(time_list)
-        elevation = np.array(elevation_list)
-        wind = np.concatenate(wind_list)
-        rmse = np.concatenate(rmse_list)
-        mask = _compute_mask(wind, rmse) | np.any(np.isnan(wind), axis=2)
+        time, elevation, wind, rmse = _compute_winds(raw, raw.scan_index, dtype)
+        if len(time) == 0:
+            raise doppy.exceptions.NoDataError("No scans with at least 4 profiles")
+        mask = _compute_mask(wind, rmse, mask_nans=True)
         if not np.allclose(elevation, elevation[0]):
             raise ValueError("Elevation is expected to stay same")
         if not (raw.height == raw.height[0]).all():
@@ -194,9 +226,28 @@ class Wind:
         | Sequence[bytes]
         | Sequence[BufferedIOBase],
         options: Options | None = None,
+        dtype: npt.DTypeLike = np.float64,
     ) -> Wind:
-        raws = doppy.raw.Wls70.from_srcs(data)
+        """
+        Parameters
+        ----------
+        dtype
+            floating point type, np.float32 or np.float64, of the wind
+            components
+        """
+        return cls.from_wls70_raw(doppy.raw.Wls70.from_srcs(data), options, dtype)
 
+    @classmethod
+    def from_wls70_raw(
+        cls,
+        raws: Sequence[doppy.raw.Wls70],
+        options: Options | None = None,
+        dtype: npt.DTypeLike = np.float64,
+    ) -> Wind:
+        """
+        Same as from_wls70_data but for parsed files
+        """
+        dtype = compute_dtype(dtype)
         if len(raws) == 0:
             raise doppy.exceptions.NoDataError("Wls70 data missing")
 
@@ -227,101 +278,213 @@ class Wind:
         return Wind(
             time=raw.time,
             height=raw.altitude,
-            zonal_wind=zonal_wind,
-            meridional_wind=meridional_wind,
-            vertical_wind=raw.vertical_wind,
+            zonal_wind=zonal_wind.astype(dtype, copy=False),
+            meridional_wind=meridional_wind.astype(dtype, copy=False),
+            vertical_wind=raw.vertical_wind.astype(dtype, copy=False),
             mask=mask,
             system_id=raw.system_id,
             options=options,
         )
 
-    def write_to_netcdf(self, filename: str | Path) -> None:
-        with doppy.netcdf.Dataset(filename) as nc:
-            nc.add_dimension("time")
-            nc.add_dimension("height")
-            nc.add_time(
-                name="time",
-                dimensions=("time",),
-                standard_name="time",
-                long_name="Time UTC",
-                data=self.time,
-                dtype="f8",
-            )
-            nc.add_variable(
-                name="height",
-                dimensions=("height",),
-                units="m",
-                data=self.height,
-                dtype="f4",
-            )
-            nc.add_variable(
-                name="uwind_raw",
-                dimensions=("time", "height"),
-                units="m s-1",
-                data=self.zonal_wind,
-                mask=self.mask_zonal_wind,
-                dtype="f4",
-                long_name="Non-screened zonal wind",
-            )
-            nc.add_variable(
-                name="uwind",
-                dimensions=("time", "height"),
-                units="m s-1",
-                data=self.zonal_wind,
-                mask=self.mask | self.mask_zonal_wind,
-                dtype="f4",
-                long_name="Zonal wind",
-            )
-            nc.add_variable(
-                name="vwind_raw",
-                dimensions=("time", "height"),
-                units="m s-1",
-                data=self.meridional_wind,
-                mask=self.mask_meridional_wind,
-                dtype="f4",
-                long_name="Non-screened meridional wind",
-            )
-            nc.add_variable(
-                name="vwind",
-                dimensions=("time", "height"),
-                units="m s-1",
-                data=self.meridional_wind,
-                mask=self.mask | self.mask_meridional_wind,
+    def write_to_netcdf(
+        self,
+        filename: str | os.PathLike[str] | BinaryIO,
+        options: doppy.netcdf.WriterOptions | None = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        filename
+            path of the file, or any other object with a write method, e.g.
+            io.BytesIO, to which the encoded file is written as bytes
+        options
+            compression, chunking and quantization of the variables, the
+            defaults are used if None
+        """
+        doppy.netcdf.write_to_file(self._write_netcdf, filename, options=options)
+
+    def write_to_bytes(
+        self, options: doppy.netcdf.WriterOptions | None = None
+    ) -> bytes:
+        """
+        Returns the netCDF file as bytes without writing to disk
+        """
+        return doppy.netcdf.write_to_bytes(self._write_netcdf, options=options)
+
+    def _write_netcdf(self, nc: doppy.netcdf.Dataset) -> None:
+        nc.add_dimension("time")
+        nc.add_dimension("height")
+        nc.add_time(
+            name="time",
+            dimensions=("time",),
+            standard_name="time",
+            long_name="Time UTC",
+            data=self.time,
+            dtype="f8",
+        )
+        nc.add_variable(
+            name="height",
+            dimensions=("height",),
+            units="m",
+            data=self.height,
+            dtype="f4",
+        )
+        nc.add_variable(
+            name="uwind_raw",
+            dimensions=("time", "height"),
+            units="m s-1",
+            data=self.zonal_wind,
+            mask=self.mask_zonal_wind,
+            dtype="f4",
+            long_name="Non-screened zonal wind",
+        )
+        nc.add_variable(
+            name="uwind",
+            dimensions=("time", "height"),
+            units="m s-1",
+            data=self.zonal_wind,
+            mask=self.mask | self.mask_zonal_wind,
+            dtype="f4",
+            long_name="Zonal wind",
+        )
+        nc.add_variable(
+            name="vwind_raw",
+            dimensions=("time", "height"),
+            units="m s-1",
+            data=self.meridional_wind,
+            mask=self.mask_meridional_wind,
+            dtype="f4",
+            long_name="Non-screened meridional wind",
+        )
+        nc.add_variable(
+            name="vwind",
+            dimensions=("time", "height"),
+            units="m s-1",
+            data=self.meridional_wind,
+            mask=self.mask | self.mask_meridional_wind,
+            dtype="f4",
+            long_name="Meridional wind",
+        )
+        nc.add_attribute("serial_number", self.system_id)
+        nc.add_attribute("doppy_version", doppy.__version__)
+        if self.options is not None and self.options.azimuth_offset_deg is not None:
+            nc.add_scalar_variable(
+                name="azimuth_offset",
+                units="degrees",
+                data=self.options.azimuth_offset_deg,
                 dtype="f4",
-                long_name="Meridional wind",
+                long_name="Azimuth offset of the instrument "
+                "(positive clockwise from north)",
             )
-            nc.add_attribute("serial_number", self.system_id)
-            nc.add_attribute("doppy_version", doppy.__version__)
-            if self.options is not None and self.options.azimuth_offset_deg is not None:
-                nc.add_scalar_variable(
-                    name="azimuth_offset",
-                    units="degrees",
-                    data=self.options.azimuth_offset_deg,
-                    dtype="f4",
-                    long_name="Azimuth offset of the instrument "
-                    "(positive clockwise from north)",
-                )
 
 
-def _compute_wind(
+def _halo_raw_for_wind(
+    raws: Sequence[doppy.raw.HaloHpl], options: Options | None, dtype: np.dtype
+) -> doppy.raw.HaloHpl:
+    """
+    Merges the profiles that the wind product is computed from
+    """
+    if len(raws) == 0:
+        raise doppy.exceptions.NoDataError("HaloHpl data missing")
+    return _merge_raws_for_wind(_select_raws_for_wind(raws), options, dtype)
+
+
+def _merge_raws_for_wind(
+    raws: Sequence[doppy.raw.HaloHpl], options: Options | None, dtype: np.dtype
+) -> doppy.raw.HaloHpl:
+    raw = (
+        doppy.raw.HaloHpl.merge(raws)
+        .sorted_by_time()
+        .non_strictly_increasing_timesteps_removed()
+        .nans_removed()
+    )
+    if len(raw.time) == 0:
+        raise doppy.exceptions.NoDataError("No suitable data for the wind product")
+    return _converted_for_wind(raw, options, dtype)
+
+
+def _converted_for_wind(
+    raw: doppy.raw.HaloHpl, options: Options | None, dtype: np.dtype
+) -> doppy.raw.HaloHpl:
+    """
+    Converts merged profiles in place to dtype and applies the azimuth offset
+    """
+    raw.radial_velocity = raw.radial_velocity.astype(dtype, copy=False)
+
+    if options and options.azimuth_offset_deg:
+        raw.azimuth += options.azimuth_offset_deg
+    return raw
+
+
+def _wind_from_merged_halo_raw(
+    raw: doppy.raw.HaloHpl, options: Options | None, dtype: np.dtype
+) -> Wind:
+    groups = _group_scans_by_azimuth_rotation(raw)
+    time, elevation, wind, rmse = _compute_winds(raw, groups, dtype)
+    if len(time) == 0:
+        raise doppy.exceptions.NoDataError(
+            "Probably something wrong with scan grouping"
+        )
+    return _halo_wind(raw, time, elevation, wind, _compute_mask(wind, rmse), options)
+
+
+def _halo_wind(
+    raw: doppy.raw.HaloHpl,
+    time: npt.NDArray[np.datetime64],
+    elevation: npt.NDArray[np.float64],
+    wind: npt.NDArray[np.float64],
+    mask: npt.NDArray[np.bool_],
+    options: Options | None,
+) -> Wind:
+    if not np.allclose(elevation, elevation[0]):
+        raise ValueError("Elevation is expected to stay same")
+    height = raw.radial_distance * np.sin(np.deg2rad(elevation[0]))
+    return Wind(
+        time=time,
+        height=height,
+        zonal_wind=wind[:, :, 0],
+        meridional_wind=wind[:, :, 1],
+        vertical_wind=wind[:, :, 2],
+        mask=mask,
+        system_id=raw.header.system_id,
+        options=options,
+    )
+
+
+def _compute_winds(
     raw: doppy.raw.HaloHpl | doppy.raw.WindCube,
-) -> tuple[float, float, npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    groups: npt.NDArray[np.int64],
+    dtype: npt.DTypeLike = np.float64,
+) -> tuple[
+    npt.NDArray[np.datetime64],
+    npt.NDArray[np.float64],
+    npt.NDArray[np.float64],
+    npt.NDArray[np.float64],
+]:
     """
+    Fits the wind for each scan, i.e. each group of profiles with the same
+    value in groups. Groups with less than 4 profiles are skipped.
+
+    The profiles are sorted by group once. Scans with the same azimuth and
+    elevation angles share the pseudo-inverse of the design matrix and are
+    solved with a single matmul.
+
     Returns
     -------
-    time
+    time (scan,):
+        Time of the middle profile of each scan, sorted
 
-    elevation
+    elevation (scan,):
+        Rounded elevation angle of each scan
 
-
-    wind (range,component):
-        Wind components for each range gate.
+    wind (scan,range,component):
+        Wind components for each range gate, in dtype.
         Components:
         0: zonal wind
         1: meridional wind
         2: vertical wind
 
-    rmse (range,):
+    rmse (scan,range):
         Root-mean-square error of radial velocity fit for each range gate.
 
     References
@@ -331,110 +494,180 @@ def _compute_wind(
         authors: E. Päschke, R. Leinweber, and V. Lehmann
         doi: 10.5194/amt-8-2251-2015
     """
-    elevation = np.deg2rad(raw.elevation)
-    azimuth = np.deg2rad(raw.azimuth)
-    radial_velocity = raw.radial_velocity
+    order = np.argsort(groups, kind="stable")
+    bounds = np.flatnonzero(np.diff(groups[order])) + 1
+    starts = np.concatenate(([0], bounds))
+    stops = np.concatenate((bounds, [len(order)]))
+    is_scan = stops - starts >= 4
+    scans = [order[start:stop] for start, stop in zip(starts[is_scan], stops[is_scan])]
+
+    nscans = len(scans)
+    ngates = raw.radial_velocity.shape[1]
+    time = np.empty(nscans, dtype=raw.time.dtype)
+    elevation = np.empty(nscans, dtype=np.float64)
+    wind = np.empty((nscans, ngates, 3), dtype=dtype)
+    rmse = np.empty((nscans, ngates), dtype=np.float64)
+
+    scans_by_geometry: defaultdict[bytes, list[int]] = defaultdict(list)
+    for i, ind in enumerate(scans):
+        time[i] = raw.time[ind[len(ind) // 2]]
+        elevation_rounded = np.round(raw.elevation[ind])
+        if not np.allclose(elevation_rounded, elevation_rounded[0]):
+            raise ValueError("Elevations in the scan differ")
+        elevation[i] = elevation_rounded[0]
+        geometry = raw.azimuth[ind].tobytes() + raw.elevation[ind].tobytes()
+        scans_by_geometry[geometry].append(i)
+
+    for same_geometry in scans_by_geometry.values():
+        ind = scans[same_geometry[0]]
+        A = _design_matrix(raw.azimuth[ind], raw.elevation[ind])
+        A_inv = np.linalg.pinv(A)
+        radial_velocity = np.stack(
+            [raw.radial_velocity[scans[i]] for i in same_geometry]
+        )
+        w = A_inv @ radial_velocity
+        r_appr = A @ w
+        rmse[same_geometry] = np.sqrt(
+            np.sum((r_appr - radial_velocity) ** 2, axis=1) / A.shape[0]
+        )
+        wind[same_geometry] = w.transpose(0, 2, 1)
+
+    time_order = np.argsort(time, kind="stable")
+    return time[time_order], elevation[time_order], wind[time_order], rmse[time_order]
+
 
+def _design_matrix(
+    azimuth: npt.NDArray[np.float64], elevation: npt.NDArray[np.float64]
+) -> npt.NDArray[np.float64]:
+    """
+    Maps (zonal, meridional, vertical) wind to the radial velocity of each
+    beam, angles in degrees
+    """
+    elevation = np.deg2rad(elevation)
+    azimuth = np.deg2rad(azimuth)
     cos_elevation = np.cos(elevation)
-    A = np.hstack(
+    return np.hstack(
         (
             (np.sin(azimuth) * cos_elevation).reshape(-1, 1),
             (np.cos(azimuth) * cos_elevation).reshape(-1, 1),
             (np.sin(elevation)).reshape(-1, 1),
         )
     )
-    A_inv = np.linalg.pinv(A)
-
-    w = A_inv @ radial_velocity
-    r_appr = A @ w
-    rmse = np.sqrt(np.sum((r_appr - radial_velocity) ** 2, axis=0) / r_appr.shape[0])
-    wind = w.T
-    time = raw.time[len(raw.time) // 2]
-    elevation = np.round(raw.elevation)
-    if not np.allclose(elevation, elevation[0]):
-        raise ValueError("Elevations in the scan differ")
-    return time, elevation[0], wind, rmse
 
 
 def _compute_mask(
-    wind: npt.NDArray[np.float64], rmse: npt.NDArray[np.float64]
+    wind: npt.NDArray[np.float64],
+    rmse: npt.NDArray[np.float64],
+    mask_nans: bool = False,
 ) -> npt.NDArray[np.bool_]:
     """
     Parameters
     ----------
 
     wind (time,range,component)
-    intensty (time,range)
     rmse (time,range)
-    """
-
-    def neighbour_diff(X: npt.NDArray[np.float64]) -> np.float64:
-        mdiff = np.max(np.abs(X - X[len(X) // 2]))
-        return np.float64(mdiff)
+    mask_nans
+        also mask gates where any wind component is nan
 
+    A gate is masked if its rmse is too large or if any wind component
+    differs too much from the same component at a neighbouring gate.
+    """
     WIND_NEIGHBOUR_DIFFERENCE = 20
-    neighbour_mask = np.any(
-        generic_filter(wind, neighbour_diff, size=(1, 3, 1))
-        > WIND_NEIGHBOUR_DIFFERENCE,
-        axis=2,
-    )
-
-    rmse_th = 5
-    return np.array((rmse > rmse_th) | neighbour_mask, dtype=np.bool_)
+    RMSE_THRESHOLD = 5
+
+    mask = np.array(rmse > RMSE_THRESHOLD, dtype=np.bool_)
+    ntimes, ngates, ncomponents = wind.shape
+    if ngates > 1:
+        diff = np.empty((ntimes, ngates - 1), dtype=np.float64)
+        neighbour_diff = np.empty((ntimes, ngates), dtype=np.float64)
+        for component in range(ncomponents):
+            x = wind[:, :, component]
+            np.subtract(x[:, 1:], x[:, :-1], out=diff, dtype=np.float64)
+            np.abs(diff, out=diff)
+            # Largest absolute difference to the neighbouring gates. Beyond
+            # the edges the neighbour is the gate itself (reflect mode), and
+            # nan propagates as in np.max
+            np.maximum(diff[:, :1], 0, out=neighbour_diff[:, :1])
+            np.maximum(diff[:, :-1], diff[:, 1:], out=neighbour_diff[:, 1:-1])
+            np.maximum(diff[:, -1:], 0, out=neighbour_diff[:, -1:])
+            mask |= (
+                neighbour_diff.astype(wind.dtype, copy=False)
+                > WIND_NEIGHBOUR_DIFFERENCE
+            )
+    if mask_nans:
+        mask |= np.isnan(wind).any(axis=2)
+    return mask
 
 
 def _group_scans_by_azimuth_rotation(raw: doppy.raw.HaloHpl) -> npt.NDArray[np.int64]:
-    max_timedelta_in_scan = np.timedelta64(30, "s")
     if len(raw.time) < 4:
         raise doppy.exceptions.NoDataError(
             "Less than 4 profiles is not sufficient for wind product."
         )
-    groups = -1 * np.ones_like(raw.time, dtype=np.int64)
-
-    group = 0
-    first_azimuth_of_scan = _wrap_and_round_angle(raw.azimuth[0])
-    groups[0] = group
-    for i, (time_prev, time, azimuth) in enumerate(
-        zip(raw.time[:-1], raw.time[1:], raw.azimuth[1:]), start=1
-    ):
-        if (
-            angle := _wrap_and_round_angle(azimuth)
-        ) == first_azimuth_of_scan or time - time_prev > max_timedelta_in_scan:
-            group += 1
-            first_azimuth_of_scan = angle
-        groups[i] = group
-    return groups
+    return group_scans_by_azimuth_rotation(raw.time, raw.azimuth)
 
 
-def _wrap_and_round_angle(a: np.float64) -> int:
-    return int(np.round(a)) % 360
+def _raws_by_configuration(
+    raws: Sequence[doppy.raw.HaloHpl],
+) -> dict[tuple[int, int], list[doppy.raw.HaloHpl]]:
+    """
+    Splits the profiles with 1 < elevation angle < 85 by (mergeable hash,
+    rounded elevation angle), keeping only the parts of each file that have
+    more than 3 distinct rounded azimuth angles. The configurations are in
+    the order of their first appearance.
+    """
+    by_configuration: dict[tuple[int, int], list[doppy.raw.HaloHpl]] = {}
+    for raw in raws:
+        hash = raw.header.mergeable_hash()
+        rounded_elevation = round_angles(raw.elevation)
+        select = (1 < raw.elevation) & (raw.elevation < 85)
+        labels = labels_by_first_appearance(rounded_elevation[select])
+        nlabels = int(labels.max()) + 1 if len(labels) > 0 else 0
+        nangles = count_distinct_per_label(
+            labels, wrap_and_round_angles(raw.azimuth[select]), nlabels
+        )
+        label_elevations = np.empty(nlabels, dtype=np.int64)
+        label_elevations[labels] = rounded_elevation[select]
+        for el, nangles_el in zip(label_elevations.tolist(), nangles.tolist()):
+            if nangles_el > 3:
+                by_configuration.setdefault((hash, el), []).append(
+                    raw[select & (rounded_elevation == el)]
+                )
+    return by_configuration
 
 
 def _select_raws_for_wind(
     raws: Sequence[doppy.raw.HaloHpl],
 ) -> Sequence[doppy.raw.HaloHpl]:
-    counter: Counter[tuple[int, int]] = Counter()
-    filtered_raws = []
-    for raw in raws:
-        select = (1 < raw.elevation) & (raw.elevation < 85)
-        for el in arr_to_rounded_set(raw.elevation[select]):
-            select_el = raw.elevation.round().astype(int) == el
-            select_and = select & select_el
-
-            if _get_nrounded_angles(raw.azimuth[select_and]) > 3:
-                filtered_raws.append(raw[select_and])
-                counter.update(
-                    Counter(
-                        (raw.header.mergeable_hash(), el)
-                        for el in raw.elevation[select_and].round().astype(int)
-                    )
-                )
+    by_configuration = _raws_by_configuration(raws)
+    return by_configuration[
+        _select_configuration(_count_profiles_by_configuration(by_configuration))
+    ]
+
+
+def _count_profiles_by_configuration(
+    by_configuration: Mapping[tuple[int, int], Sequence[doppy.raw.HaloHpl]],
+) -> Counter[tuple[int, int]]:
+    return Counter(
+        {
+            key: sum(len(raw.time) for raw in configuration_raws)
+            for key, configuration_raws in by_configuration.items()
+        }
+    )
+
+
+def _select_configuration(counter: Counter[tuple[int, int]]) -> tuple[int, int]:
+    """
+    Returns the (mergeable hash, rounded elevation angle) configuration that
+    the wind product is computed from, given the number of profiles of each
+    configuration in the order of their first appearance
+    """
     if len(counter) == 0:
         raise doppy.exceptions.NoDataError(
             "No scans with 1 < elevation angle < 85 and more than 3 azimuth angles"
         )
     if len(counter) == 1:
-        return filtered_raws
+        return next(iter(counter))
     # Else select angle closes to 75 from angles
     # that have count larger than mean_count/2
     mean_count = counter.total() / len(counter)
@@ -446,15 +679,4 @@ def _select_raws_for_wind(
         ],
         key=lambda x: x[1],
     )[0]
-    elevation_set = {elevation}
-    raws = [
-        raw
-        for raw in filtered_raws
-        if raw.header.mergeable_hash() == hash
-        and arr_to_rounded_set(raw.elevation) == elevation_set
-    ]
-    return raws
-
-
-def _get_nrounded_angles(arr: npt.NDArray[np.float64]) -> int:
-    return len(set((x + 360) % 360 for x in arr_to_rounded_set(arr)))
+    return (hash, elevation)
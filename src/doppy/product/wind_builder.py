@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+from collections import Counter
+from io import BufferedIOBase
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+import doppy
+from doppy.product.stare_builder import _concatenated_time
+from doppy.product.utils import compute_dtype
+from doppy.product.wind import (
+    Options,
+    Wind,
+    _compute_mask,
+    _compute_winds,
+    _converted_for_wind,
+    _halo_wind,
+    _merge_raws_for_wind,
+    _raws_by_configuration,
+    _select_configuration,
+)
+from doppy.scan_segmentation import (
+    MAX_TIMEDELTA_IN_SCAN,
+    group_scans_by_azimuth_rotation,
+)
+
+
+class WindBuilder:
+    """
+    Builds a HALO wind product incrementally as new scan files arrive during
+    the day.
+
+    New files are split by scan configuration as they arrive, and their
+    profiles are merged to the previously merged profiles when they are later
+    than them. The wind fits of completed scans are kept between calls to
+    `add`. Only scans that are new or whose profiles changed are fitted
+    again, and the quality control mask is computed only for them.
+
+    The last scan is held back until it is complete, i.e. until a profile of
+    the next scan arrives or, if `now` is given, until more than 30 s have
+    passed since its last profile. `finish` includes the last scan as is, and
+    the returned product is then identical to running `Wind.from_halo_data`
+    on all the files given so far.
+
+    Examples
+    --------
+    >>> builder = WindBuilder()
+    >>> wind = builder.add(vad_files_so_far)
+    >>> wind = builder.add([new_vad_file], now=np.datetime64("now"))
+    >>> if wind is not None:
+    ...     wind.write_to_netcdf("wind.nc")
+    >>> wind = builder.finish()
+    """
+
+    def __init__(
+        self, options: Options | None = None, dtype: npt.DTypeLike = np.float64
+    ) -> None:
+        self.options = options
+        self.dtype = compute_dtype(dtype)
+        self._by_configuration: dict[tuple[int, int], list[doppy.raw.HaloHpl]] = {}
+        self._counts: Counter[tuple[int, int]] = Counter()
+        self._merged: _MergedRaw | None = None
+        self._state: _WindState | None = None
+
+    @property
+    def wind(self) -> Wind:
+        if self._state is None or len(self._state.scans) == 0:
+            raise doppy.exceptions.NoDataError("No complete scans processed yet")
+        return self._state.to_wind(self.options)
+
+    def add(
+        self,
+        data: Sequence[str]
+        | Sequence[Path]
+        | Sequence[bytes]
+        | Sequence[BufferedIOBase],
+        now: np.datetime64 | None = None,
+    ) -> Wind | None:
+        """
+        Adds new HPL files and returns the product of the completed scans, or
+        None if no scan is complete yet.
+
+        Parameters
+        ----------
+        now
+            current time, the last scan is considered complete if its last
+            profile is more than 30 s older
+        """
+        for key, raws in _raws_by_configuration(
+            doppy.raw.HaloHpl.from_srcs(data)
+        ).items():
+            self._by_configuration.setdefault(key, []).extend(raws)
+            self._counts[key] += sum(len(raw.time) for raw in raws)
+        if len(self._counts) == 0:
+            return None
+        try:
+            self._update(now, finish=False)
+        except doppy.exceptions.NoDataError:
+            # No profiles of the selected configuration are left after
+            # removing the invalid ones
+            return None
+        if self._state is None or len(self._state.scans) == 0:
+            return None
+        return self._state.to_wind(self.options)
+
+    def finish(self) -> Wind:
+        """
+        Returns the product including the last scan even if it is incomplete.
+
+        Raises NoDataError if no wind can be computed from the files.
+        """
+        self._update(None, finish=True)
+        return self.wind
+
+    def _update(self, now: np.datetime64 | None, finish: bool) -> None:
+        raw, groups, appended = self._merge(_select_configuration(self._counts))
+        if finish or (
+            now is not None
+            and np.datetime64(now) - raw.time[-1] > MAX_TIMEDELTA_IN_SCAN
+        ):
+            ncomplete = len(raw.time)
+        else:
+            ncomplete = int(np.searchsorted(groups, groups[-1]))
+        self._state = _update_state(
+            self._state, raw, groups[:ncomplete], ncomplete, appended, self.dtype
+        )
+
+    def _merge(
+        self, configuration: tuple[int, int]
+    ) -> tuple[doppy.raw.HaloHpl, npt.NDArray[np.int64], bool]:
+        """
+        Returns the merged profiles of configuration, their scan numbers and
+        whether they were appended to the previously merged profiles.
+
+        If the profiles of the new files are in time order and later than all
+        merged profiles, sorting and removing duplicate times would not change
+        the merged profiles, and merging only the new files gives the same
+        result as merging all files again. The scans before the last merged
+        scan then stay the same, so the profiles are grouped into scans again
+        only from the start of the last scan.
+        """
+        parts = self._by_configuration[configuration]
+        merged = self._merged
+        if (
+            merged is not None
+            and merged.configuration == configuration
+            and merged.is_increasing
+        ):
+            new_time = _concatenated_time(parts[merged.nparts :])
+            if len(new_time) == 0:
+                self._merged = merged.extended(
+                    len(parts), merged.raw, merged.groups, None
+                )
+                return merged.raw, merged.groups, True
+            if new_time[0] > merged.last_time and bool(
+                np.all(new_time[1:] > new_time[:-1])
+            ):
+                tail = doppy.raw.HaloHpl.merge(parts[merged.nparts :]).nans_removed()
+                raw, groups = merged.raw, merged.groups
+                if len(tail.time) > 0:
+                    raw = doppy.raw.HaloHpl.merge(
+                        [raw, _converted_for_wind(tail, self.options, self.dtype)]
+                    )
+                    start = int(np.searchsorted(groups, groups[-1]))
+                    groups = np.concatenate(
+                        (
+                            groups[:start],
+                            groups[start]
+                            + group_scans_by_azimuth_rotation(
+                                raw.time[start:], raw.azimuth[start:]
+                            ),
+                        )
+                    )
+                self._merged = merged.extended(len(parts), raw, groups, new_time[-1])
+                return raw, groups, True
+
+        time = _concatenated_time(parts)
+        raw = _merge_raws_for_wind(parts, self.options, self.dtype)
+        groups = group_scans_by_azimuth_rotation(raw.time, raw.azimuth)
+        self._merged = _MergedRaw(
+            configuration=configuration,
+            raw=raw,
+            groups=groups,
+            nparts=len(parts),
+            last_time=time[-1],
+            is_increasing=bool(np.all(time[1:] > time[:-1])),
+        )
+        return raw, groups, False
+
+
+class _MergedRaw:
+    """
+    Merged profiles of the selected scan configuration
+
+    Parameters
+    ----------
+    groups
+        scan numbers of the profiles
+    nparts
+        number of file parts of the configuration merged so far
+    last_time
+        time of the last profile of the file parts in the order they were given
+    is_increasing
+        whether the profiles of the file parts, in the order they were given,
+        have strictly increasing times
+    """
+
+    def __init__(
+        self,
+        configuration: tuple[int, int],
+        raw: doppy.raw.HaloHpl,
+        groups: npt.NDArray[np.int64],
+        nparts: int,
+        last_time: np.datetime64,
+        is_increasing: bool,
+    ) -> None:
+        self.configuration = configuration
+        self.raw = raw
+        self.groups = groups
+        self.nparts = nparts
+        self.last_time = last_time
+        self.is_increasing = is_increasing
+
+    def extended(
+        self,
+        nparts: int,
+        raw: doppy.raw.HaloHpl,
+        groups: npt.NDArray[np.int64],
+        last_time: np.datetime64 | None,
+    ) -> _MergedRaw:
+        return _MergedRaw(
+            configuration=self.configuration,
+            raw=raw,
+            groups=groups,
+            nparts=nparts,
+            last_time=last_time if last_time is not None else self.last_time,
+            is_increasing=True,
+        )
+
+
+class _WindState:
+    def __init__(
+        self,
+        raw: doppy.raw.HaloHpl,
+        scans: list[tuple[int, int]],
+        time: npt.NDArray[np.datetime64],
+        elevation: npt.NDArray[np.float64],
+        wind: npt.NDArray[np.float64],
+        mask: npt.NDArray[np.bool_],
+    ) -> None:
+        self.raw = raw
+        self.scans = scans
+        self.time = time
+        self.elevation = elevation
+        self.wind = wind
+        self.mask = mask
+
+    def to_wind(self, options: Options | None) -> Wind:
+        return _halo_wind(
+            self.raw, self.time, self.elevation, self.wind, self.mask, options
+        )
+
+
+def _update_state(
+    prev: _WindState | None,
+    raw: doppy.raw.HaloHpl,
+    groups: npt.NDArray[np.int64],
+    ncomplete: int,
+    appended: bool,
+    dtype: np.dtype,
+) -> _WindState:
+    """
+    Parameters
+    ----------
+    groups
+        scan numbers of the first ncomplete profiles of raw
+    appended
+        whether raw consists of the profiles of prev followed by new profiles
+    """
+    scans = _scans(groups)
+    if appended and prev is not None:
+        ncommon = len(prev.raw.time)
+    else:
+        ncommon = _ncommon_profiles(prev, raw)
+    nkeep = 0
+    if prev is not None:
+        while (
+            nkeep < min(len(scans), len(prev.scans))
+            and scans[nkeep] == prev.scans[nkeep]
+            and scans[nkeep][1] <= ncommon
+        ):
+            nkeep += 1
+
+    start = scans[nkeep][0] if nkeep < len(scans) else ncomplete
+    time, elevation, wind, rmse = _compute_winds(
+        raw[start:ncomplete], groups[start:ncomplete], dtype
+    )
+    mask = _compute_mask(wind, rmse)
+    if prev is not None and nkeep > 0:
+        time = np.concatenate((prev.time[:nkeep], time))
+        elevation = np.concatenate((prev.elevation[:nkeep], elevation))
+        wind = np.concatenate((prev.wind[:nkeep], wind))
+        mask = np.concatenate((prev.mask[:nkeep], mask))
+    return _WindState(raw, scans, time, elevation, wind, mask)
+
+
+def _scans(groups: npt.NDArray[np.int64]) -> list[tuple[int, int]]:
+    """
+    Returns (start, stop) index pairs of the scans with at least 4 profiles,
+    groups must be non-decreasing
+    """
+    bounds = np.flatnonzero(np.diff(groups)) + 1
+    starts = np.concatenate(([0], bounds))
+    stops = np.concatenate((bounds, [len(groups)]))
+    is_scan = stops - starts >= 4
+    return [(int(a), int(b)) for a, b in zip(starts[is_scan], stops[is_scan])]
+
+
+def _ncommon_profiles(prev: _WindState | None, raw: doppy.raw.HaloHpl) -> int:
+    """
+    Number of leading profiles that are the same as in prev
+    """
+    if (
+        prev is None
+        or prev.raw.header.mergeable_hash() != raw.header.mergeable_hash()
+        or not np.array_equal(prev.raw.radial_distance, raw.radial_distance)
+    ):
+        return 0
+    nmin = min(len(raw.time), len(prev.raw.time))
+    same = (
+        (prev.raw.time[:nmin] == raw.time[:nmin])
+        & (prev.raw.azimuth[:nmin] == raw.azimuth[:nmin])
+        & (prev.raw.elevation[:nmin] == raw.elevation[:nmin])
+        & np.all(prev.raw.radial_velocity[:nmin] == raw.radial_velocity[:nmin], axis=1)
+    )
+    return nmin if same.all() else int(np.argmin(same))
@@ -1,9 +1,45 @@
-from .halo_bg import HaloBg
-from .halo_hpl import HaloHpl
-from .halo_sys_params import HaloSysParams
-from .windcube import WindCube, WindCubeFixed
-from .wls70 import Wls70
-from .wls77 import Wls77
+from __future__ import annotations
+
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .halo_bg import HaloBg
+    from .halo_hpl import HaloHpl
+    from .halo_sys_params import HaloSysParams
+    from .windcube import WindCube, WindCubeFixed
+    from .wls70 import Wls70
+    from .wls77 import Wls77
+
+_LAZY_ATTRIBUTES = {
+    "HaloHpl": ".halo_hpl",
+    "HaloBg": ".halo_bg",
+    "HaloSysParams": ".halo_sys_params",
+    "WindCube": ".windcube",
+    "WindCubeFixed": ".windcube",
+    "Wls70": ".wls70",
+    "Wls77": ".wls77",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    # Submodules, such as `halo_hpl`, are imported on first access as well
+    try:
+        return importlib.import_module(f"{__name__}.{name}")
+    except ModuleNotFoundError as err:
+        if err.name != f"{__name__}.{name}":
+            raise
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
 
 __all__ = [
     "HaloHpl",
@@ -54,24 +54,8 @@ class HaloBg:
         TypeError
             If `data` is not a list or tuple of supported types.
         """
-        if not isinstance(data, (list, tuple)):
-            raise TypeError("data should be list or tuple")
-        # TODO: rust reader and proper type checking
-        data_normalised = []
-        for item in data:
-            if isinstance(item, str):
-                path = Path(item)
-                with path.open("rb") as f:
-                    data_normalised.append((f.read(), path.name))
-            elif isinstance(item, Path):
-                with item.open("rb") as f:
-                    data_normalised.append((f.read(), item.name))
-            elif isinstance(item, tuple) and isinstance(item[0], bytes):
-                data_normalised.append(item)
-            elif isinstance(item, tuple) and isinstance(item[0], BufferedIOBase):
-                data_normalised.append((item[0].read(), item[1]))
         bgs = []
-        for data_bytes, filename in data_normalised:
+        for data_bytes, filename in _read_srcs(data):
             try:
                 bgs.append(HaloBg.from_src(data_bytes, filename))
             except RawParsingError:
@@ -137,12 +121,52 @@ class HaloBg:
         return self[is_increasing]
 
 
-def _from_src(data: BufferedIOBase, filename: str) -> HaloBg:
+def _read_srcs(
+    data: Sequence[str]
+    | Sequence[Path]
+    | Sequence[tuple[bytes, str]]
+    | Sequence[tuple[BufferedIOBase, str]],
+) -> list[tuple[bytes, str]]:
+    """
+    Returns the content and filename of each source
+    """
+    if not isinstance(data, (list, tuple)):
+        raise TypeError("data should be list or tuple")
+    # TODO: rust reader and proper type checking
+    data_normalised = []
+    for item in data:
+        if isinstance(item, str):
+            path = Path(item)
+            with path.open("rb") as f:
+                data_normalised.append((f.read(), path.name))
+        elif isinstance(item, Path):
+            with item.open("rb") as f:
+                data_normalised.append((f.read(), item.name))
+        elif isinstance(item, tuple) and isinstance(item[0], bytes):
+            data_normalised.append(item)
+        elif isinstance(item, tuple) and isinstance(item[0], BufferedIOBase):
+            data_normalised.append((item[0].read(), item[1]))
+    return data_normalised
+
+
+def _src_filename(
+    src: str | Path | tuple[bytes, str] | tuple[BufferedIOBase, str],
+) -> str:
+    if isinstance(src, str):
+        return Path(src).name
+    if isinstance(src, Path):
+        return src.name
+    return src[1]
+
+
+def _time_from_filename(filename: str) -> datetime64:
     if not (m := re.match(r"^Background_(\d{6}-\d{6}).txt", filename)):
         raise ValueError(f"Cannot parse datetime from filename: {filename}")
-    time = np.array(datetime64(datetime.strptime(m.group(1), "%d%m%y-%H%M%S")))[
-        np.newaxis
-    ]
+    return datetime64(datetime.strptime(m.group(1), "%d%m%y-%H%M%S"))
+
+
+def _from_src(data: BufferedIOBase, filename: str) -> HaloBg:
+    time = np.array(_time_from_filename(filename))[np.newaxis]
 
     data_bytes = data.read().strip()
     if b"\r\n" not in data_bytes:
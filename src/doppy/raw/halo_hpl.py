@@ -17,6 +17,7 @@ from numpy import datetime64, timedelta64
 import doppy
 from doppy import exceptions
 from doppy.raw.utils import bytes_from_src
+from doppy.scan_segmentation import strictly_increasing_mask
 from doppy.utils import merge_all_equal
 
 
@@ -126,23 +127,35 @@ class HaloHpl:
         raise TypeError
 
     def sorted_by_time(self) -> HaloHpl:
+        """
+        Returns self if the profiles are already in time order, otherwise a
+        new object with the profiles copied in time order
+        """
+        if np.all(self.time[1:] > self.time[:-1]):
+            return self
         sort_indices = np.argsort(self.time)
         return self[sort_indices]
 
     def non_strictly_increasing_timesteps_removed(self) -> HaloHpl:
+        """
+        Returns self if no profile is removed, otherwise a new object with the
+        remaining profiles copied
+        """
         if len(self.time) == 0:
             return self
-        mask = np.ones_like(self.time, dtype=np.bool_)
-        latest_time = self.time[0]
-        for i, t in enumerate(self.time[1:], start=1):
-            if t <= latest_time:
-                mask[i] = False
-            else:
-                latest_time = t
+        mask = strictly_increasing_mask(self.time)
+        if mask.all():
+            return self
         return self[mask]
 
     def nans_removed(self) -> HaloHpl:
+        """
+        Returns self if no profile is removed, otherwise a new object with the
+        remaining profiles copied
+        """
         is_ok = np.array(~np.isnan(self.intensity).any(axis=1), dtype=np.bool_)
+        if is_ok.all():
+            return self
         return self[is_ok]
 
 
@@ -3,15 +3,21 @@ from __future__ import annotations
 from dataclasses import dataclass
 from io import BufferedIOBase
 from pathlib import Path
-from typing import Sequence
+from typing import TYPE_CHECKING, Sequence
 
 import numpy as np
 import numpy.typing as npt
-from netCDF4 import Dataset, Variable, num2date
 from numpy import datetime64
 
+from doppy.scan_segmentation import (
+    labels_by_first_appearance,
+    strictly_increasing_mask,
+)
 from doppy.utils import merge_all_equal
 
+if TYPE_CHECKING:
+    from netCDF4 import Dataset, Variable
+
 
 @dataclass
 class WindCubeFixed:
@@ -39,6 +45,8 @@ class WindCubeFixed:
 
     @classmethod
     def from_fixed_src(cls, data: str | Path | bytes | BufferedIOBase) -> WindCubeFixed:
+        from netCDF4 import Dataset
+
         data_bytes = _src_to_bytes(data)
         nc = Dataset("inmemory.nc", "r", memory=data_bytes)
         return _from_fixed_src(nc)
@@ -125,6 +133,8 @@ class WindCube:
 
     @classmethod
     def from_vad_or_dbs_src(cls, data: str | Path | bytes | BufferedIOBase) -> WindCube:
+        from netCDF4 import Dataset
+
         data_bytes = _src_to_bytes(data)
         nc = Dataset("inmemory.nc", "r", memory=data_bytes)
         return _from_vad_or_dbs_src(nc)
@@ -177,26 +187,13 @@ class WindCube:
     def non_strictly_increasing_timesteps_removed(self) -> WindCube:
         if len(self.time) == 0:
             return self
-        mask = np.ones_like(self.time, dtype=np.bool_)
-        latest_time = self.time[0]
-        for i, t in enumerate(self.time[1:], start=1):
-            if t <= latest_time:
-                mask[i] = False
-            else:
-                latest_time = t
+        mask = strictly_increasing_mask(self.time)
         return self[mask]
 
     def reindex_scan_indices(self) -> WindCube:
-        new_indices = np.zeros_like(self.scan_index)
-        indexed = set()
-        j = 0
-        for i in self.scan_index:
-            if i in indexed:
-                continue
-            new_indices[i == self.scan_index] = j
-            indexed.add(i)
-            j += 1
-        self.scan_index = new_indices
+        self.scan_index = labels_by_first_appearance(self.scan_index).astype(
+            self.scan_index.dtype, copy=False
+        )
         return self
 
 
@@ -385,6 +382,8 @@ def _from_vad_or_dbs_src(nc: Dataset) -> WindCube:
 def _extract_datetime64_or_raise(
     nc: Variable[npt.NDArray[np.float64]], time_reference: str | None
 ) -> npt.NDArray[np.datetime64]:
+    from netCDF4 import num2date
+
     match nc.name:
         case "time":
             if nc.dimensions != ("time",):
@@ -0,0 +1,102 @@
+"""
+Vectorised segmentation of profile sequences into scans, shared by the raw
+readers and the wind product.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import numpy.typing as npt
+
+MAX_TIMEDELTA_IN_SCAN = np.timedelta64(30, "s")
+
+
+def round_angles(arr: npt.NDArray[np.float64]) -> npt.NDArray[np.int64]:
+    """
+    Angles rounded to integer degrees
+    """
+    return np.round(arr).astype(np.int64)
+
+
+def wrap_and_round_angles(arr: npt.NDArray[np.float64]) -> npt.NDArray[np.int64]:
+    """
+    Angles rounded to integer degrees and wrapped to [0, 360)
+    """
+    return round_angles(arr) % 360
+
+
+def strictly_increasing_mask(time: npt.NDArray[np.datetime64]) -> npt.NDArray[np.bool_]:
+    """
+    mask[i] = True iff time[i] is later than all of time[:i]
+    """
+    mask = np.ones(len(time), dtype=np.bool_)
+    if len(time) > 1:
+        mask[1:] = time[1:] > np.maximum.accumulate(time[:-1])
+    return mask
+
+
+def labels_by_first_appearance(arr: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+    """
+    Relabels the values of arr with 0, 1, 2, ... in the order in which they
+    first appear in arr
+    """
+    _, first, inverse = np.unique(arr, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first, kind="stable")] = np.arange(len(first))
+    return rank[inverse.reshape(-1)]
+
+
+def count_distinct_per_label(
+    labels: npt.NDArray[np.int64], values: npt.NDArray[np.int64], nlabels: int
+) -> npt.NDArray[np.int64]:
+    """
+    Number of distinct values for each label in 0, ..., nlabels - 1
+    """
+    if len(labels) == 0:
+        return np.zeros(nlabels, dtype=np.int64)
+    pairs = np.unique(np.stack((labels, values), axis=1), axis=0)
+    return np.bincount(pairs[:, 0], minlength=nlabels).astype(np.int64)
+
+
+def group_scans_by_azimuth_rotation(
+    time: npt.NDArray[np.datetime64],
+    azimuth: npt.NDArray[np.float64],
+    max_timedelta_in_scan: np.timedelta64 = MAX_TIMEDELTA_IN_SCAN,
+) -> npt.NDArray[np.int64]:
+    """
+    Labels consecutive profiles with scan numbers 0, 1, 2, ...
+
+    A new scan starts when the rounded azimuth angle of a profile equals the
+    rounded azimuth angle of the first profile of the current scan, or when
+    the time step from the previous profile is larger than
+    max_timedelta_in_scan.
+
+    The first profile of each scan depends on where the previous scan
+    started, so the scan starts are followed one scan at a time. The next
+    start for every profile is precomputed with array operations.
+    """
+    n = len(time)
+    groups = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return groups
+    angle = wrap_and_round_angles(azimuth)
+
+    # Next profile with the same rounded angle, or n if there is none
+    order = np.argsort(angle, kind="stable")
+    next_same_angle = np.full(n, n, dtype=np.int64)
+    same = angle[order[1:]] == angle[order[:-1]]
+    next_same_angle[order[:-1][same]] = order[1:][same]
+
+    # Next profile after a time gap, or n if there is none
+    gaps = np.flatnonzero(np.diff(time) > max_timedelta_in_scan) + 1
+    gaps = np.append(gaps, n)
+    next_gap = gaps[np.searchsorted(gaps, np.arange(n), side="right")]
+
+    next_start = np.minimum(next_same_angle, next_gap).tolist()
+    starts = []
+    i = next_start[0]
+    while i < n:
+        starts.append(i)
+        i = next_start[i]
+    groups[starts] = 1
+    return np.cumsum(groups)
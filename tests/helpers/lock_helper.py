@@ -5,25 +5,29 @@ Usage: python -m tests.helpers.lock_helper '<test-case-json>'
 Input (CLI arg): JSON with test case definition including "product" field
     and "records" array with local file paths.
 Output (stdout): JSON with { "input": { "files": [...] }, "expect": { ... } }
+
+Cases can compare other ways of computing the same product with the main
+one, e.g. [stare.options] compare = ["builder"]. The helper fails if they
+differ.
 """
 
+import dataclasses
 import hashlib
 import io
 import json
 import re
 import sys
+import tempfile
 from collections import defaultdict
+from pathlib import Path
 
 import numpy as np
 from scipy import stats as scipy_stats
 
 import doppy
 from doppy import options, product
-from doppy.product.turbulence import (
-    HorizontalWind,
-    Turbulence,
-    VerticalWind,
-)
+from doppy.product.stare import PulsesPerRay, RayAccumulationTime
+from doppy.product.turbulence import HorizontalWind, Turbulence, VerticalWind
 from doppy.product.turbulence import Options as TurbulenceOptions
 from doppy.product.wind import Wind
 
@@ -102,6 +106,345 @@ def halo_cross_records(records: list[dict]) -> list[dict]:
     ]
 
 
+def dtype_option(case: dict) -> np.dtype:
+    """Compute dtype from case options, e.g. [stare.options] dtype = "float32"."""
+    opts = case.get("options") or {}
+    return np.dtype(opts.get("dtype", "float64"))
+
+
+def compare_option(case: dict) -> list[str]:
+    """Processing paths to compare, e.g. [stare.options] compare = ["builder"]."""
+    opts = case.get("options") or {}
+    return opts.get("compare") or []
+
+
+def check_identical(
+    path: str, a: object, b: object, mask_fraction: float = 0.0
+) -> None:
+    """Raise unless all fields of two products are equal, NaN == NaN.
+
+    Up to mask_fraction of the elements of boolean arrays may differ.
+    """
+    for field in dataclasses.fields(a):
+        x, y = getattr(a, field.name), getattr(b, field.name)
+        if isinstance(x, np.ndarray):
+            if x.dtype != y.dtype or x.shape != y.shape:
+                same = False
+            elif x.dtype == np.bool_:
+                same = np.count_nonzero(x != y) <= mask_fraction * x.size
+            else:
+                same = np.array_equal(x, y, equal_nan=x.dtype.kind in "fcmM")
+        else:
+            same = x == y
+        if not same:
+            raise RuntimeError(f"{path}: {field.name} differs from the main product")
+
+
+def check_netcdf_bytes(path: str, prod: product.Stare | Wind) -> None:
+    """Raise unless write_to_bytes gives the content of write_to_netcdf's file.
+
+    The encoded files are not byte for byte equal, so their attributes,
+    dimensions and variables are compared.
+    """
+    import netCDF4
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = Path(tmpdir) / "product.nc"
+        prod.write_to_netcdf(filename)
+        file_content = filename.read_bytes()
+
+    with (
+        netCDF4.Dataset("bytes.nc", memory=prod.write_to_bytes()) as nc_a,
+        netCDF4.Dataset("file.nc", memory=file_content) as nc_b,
+    ):
+        if nc_a.__dict__ != nc_b.__dict__:
+            raise RuntimeError(f"{path}: global attributes differ from the file")
+        if {name: len(dim) for name, dim in nc_a.dimensions.items()} != {
+            name: len(dim) for name, dim in nc_b.dimensions.items()
+        }:
+            raise RuntimeError(f"{path}: dimensions differ from the file")
+        if nc_a.variables.keys() != nc_b.variables.keys():
+            raise RuntimeError(f"{path}: variables differ from the file")
+        for name, var_a in nc_a.variables.items():
+            var_b = nc_b.variables[name]
+            values_a, values_b = var_a[:], var_b[:]
+            if (
+                var_a.dimensions != var_b.dimensions
+                or var_a.dtype != var_b.dtype
+                or var_a.filters() != var_b.filters()
+                or var_a.__dict__.keys() != var_b.__dict__.keys()
+                or not all(
+                    np.array_equal(var_a.__dict__[k], var_b.__dict__[k])
+                    for k in var_a.__dict__
+                )
+                or not np.array_equal(
+                    np.ma.getmaskarray(values_a), np.ma.getmaskarray(values_b)
+                )
+                or not np.array_equal(np.ma.getdata(values_a), np.ma.getdata(values_b))
+            ):
+                raise RuntimeError(f"{path}: variable {name} differs from the file")
+
+
+# ── Comparisons ──────────────────────────────────────────────────────
+
+# The moving means of the stare noise mask depend on how the profiles are
+# split, so the mask can differ where a mean is within rounding of its
+# threshold
+STARE_MASK_FRACTION = 1e-6
+
+
+def compare_stare_builder(
+    stare: product.Stare,
+    data_hpl: list[tuple[bytes, str]],
+    data_bg: list[tuple[bytes, str]],
+    noise_mask_method: options.NoiseMaskMethod,
+    dtype: np.dtype,
+) -> None:
+    """StareBuilder fed one HPL file at a time, backgrounds spread evenly."""
+    data_hpl = sorted(data_hpl, key=lambda d: d[1])
+    data_bg = sorted(data_bg, key=lambda d: d[1])
+    builder = product.StareBuilder(noise_mask_method=noise_mask_method, dtype=dtype)
+    nbg = 0
+    for i, (hpl, _) in enumerate(data_hpl):
+        nbg_next = -(-(i + 1) * len(data_bg) // len(data_hpl))
+        try:
+            builder.append([hpl], data_bg[nbg:nbg_next])
+        except doppy.exceptions.NoDataError:
+            # No profiles with a background measurement yet
+            pass
+        nbg = nbg_next
+    check_identical("builder", builder.stare, stare, STARE_MASK_FRACTION)
+
+
+def compare_stare_blocks(
+    stare: product.Stare,
+    data_hpl: list[tuple[bytes, str]],
+    data_bg: list[tuple[bytes, str]],
+    noise_mask_method: options.NoiseMaskMethod,
+    dtype: np.dtype,
+) -> None:
+    """Stare.from_halo_data processing the profiles in blocks."""
+    blocks = product.Stare.from_halo_data(
+        data=[hpl for hpl, _ in data_hpl],
+        data_bg=data_bg,
+        bg_correction_method=options.BgCorrectionMethod.FIT,
+        noise_mask_method=noise_mask_method,
+        block_profiles=1000,
+        dtype=dtype,
+    )
+    check_identical("blocks", blocks, stare, STARE_MASK_FRACTION)
+
+
+def compare_stare_workers(
+    stare: product.Stare,
+    data_hpl: list[tuple[bytes, str]],
+    data_bg: list[tuple[bytes, str]],
+    noise_mask_method: options.NoiseMaskMethod,
+    dtype: np.dtype,
+) -> None:
+    """Stare.from_halo_data running the noise filters on four threads."""
+    threaded = product.Stare.from_halo_data(
+        data=[hpl for hpl, _ in data_hpl],
+        data_bg=data_bg,
+        bg_correction_method=options.BgCorrectionMethod.FIT,
+        noise_mask_method=noise_mask_method,
+        workers=4,
+        dtype=dtype,
+    )
+    check_identical("workers", threaded, stare)
+
+
+def compare_stare_pipeline(
+    stare: product.Stare,
+    data_hpl: list[tuple[bytes, str]],
+    data_bg: list[tuple[bytes, str]],
+    noise_mask_method: options.NoiseMaskMethod,
+    dtype: np.dtype,
+) -> None:
+    """StarePipeline switched through all noise mask methods back to the case's."""
+    if dtype != np.float64:
+        raise ValueError("StarePipeline computes only float64 products")
+    pipeline = product.StarePipeline([hpl for hpl, _ in data_hpl], data_bg)
+    for method in options.NoiseMaskMethod:
+        pipeline.noise_mask_method = method
+        pipeline.stare
+    pipeline.noise_mask_method = noise_mask_method
+    check_identical("pipeline", pipeline.stare, stare)
+
+
+def compare_stare_bytes(
+    stare: product.Stare,
+    data_hpl: list[tuple[bytes, str]],
+    data_bg: list[tuple[bytes, str]],
+    noise_mask_method: options.NoiseMaskMethod,
+    dtype: np.dtype,
+) -> None:
+    """Stare.write_to_bytes against the file written by write_to_netcdf."""
+    check_netcdf_bytes("bytes", stare)
+
+
+STARE_COMPARISONS = {
+    "builder": compare_stare_builder,
+    "blocks": compare_stare_blocks,
+    "workers": compare_stare_workers,
+    "pipeline": compare_stare_pipeline,
+    "bytes": compare_stare_bytes,
+}
+
+
+def compare_wind_builder(
+    wind: Wind,
+    data: list[tuple[bytes, str]],
+    wind_options: product.wind.Options | None,
+    dtype: np.dtype,
+) -> None:
+    """WindBuilder fed one wind scan HPL file at a time."""
+    builder = product.WindBuilder(options=wind_options, dtype=dtype)
+    for hpl, _ in sorted(data, key=lambda d: d[1]):
+        builder.add([hpl])
+    check_identical("builder", builder.finish(), wind)
+
+
+def compare_wind_all(
+    wind: Wind,
+    data: list[tuple[bytes, str]],
+    wind_options: product.wind.Options | None,
+    dtype: np.dtype,
+) -> None:
+    """Wind.all_from_halo_data, one of whose products is the main one."""
+    winds = Wind.all_from_halo_data(
+        [hpl for hpl, _ in data], options=wind_options, dtype=dtype
+    )
+    for other in winds:
+        try:
+            check_identical("all", other, wind)
+            return
+        except RuntimeError:
+            continue
+    raise RuntimeError(
+        f"all: none of the {len(winds)} products is identical to the main product"
+    )
+
+
+def compare_wind_bytes(
+    wind: Wind,
+    data: list[tuple[bytes, str]],
+    wind_options: product.wind.Options | None,
+    dtype: np.dtype,
+) -> None:
+    """Wind.write_to_bytes against the file written by write_to_netcdf."""
+    check_netcdf_bytes("bytes", wind)
+
+
+WIND_COMPARISONS = {
+    "builder": compare_wind_builder,
+    "all": compare_wind_all,
+    "bytes": compare_wind_bytes,
+}
+
+
+def _winds_for_turbulence(
+    stare: product.Stare, wind: Wind
+) -> tuple[VerticalWind, HorizontalWind]:
+    vert = VerticalWind(
+        time=stare.time,
+        height=stare.radial_distance,
+        w=stare.radial_velocity,
+        mask=stare.mask_radial_velocity,
+    )
+    hori = HorizontalWind(
+        time=wind.time, height=wind.height, V=wind.horizontal_wind_speed
+    )
+    return vert, hori
+
+
+def compare_turbulence_periods(
+    turb: Turbulence,
+    stare: product.Stare,
+    wind: Wind,
+    turbulence_options: TurbulenceOptions,
+    dtype: np.dtype,
+) -> None:
+    """Turbulence.from_winds_for_periods, each period against from_winds."""
+    vert, hori = _winds_for_turbulence(stare, wind)
+    period = turbulence_options.period
+    periods = [period, period / 2, 3 * period]
+    turbs = Turbulence.from_winds_for_periods(
+        vert, hori, turbulence_options, periods, dtype=dtype
+    )
+    for p, other in zip(periods, turbs):
+        check_identical(
+            f"periods ({p} s)",
+            other,
+            Turbulence.from_winds(
+                vert,
+                hori,
+                dataclasses.replace(turbulence_options, period=p),
+                dtype=dtype,
+            ),
+        )
+
+
+def compare_turbulence_from_winds(
+    turb: Turbulence,
+    stare: product.Stare,
+    wind: Wind,
+    turbulence_options: TurbulenceOptions,
+    dtype: np.dtype,
+) -> None:
+    """Turbulence.from_winds on all wind profiles, with the ray accumulation
+    time given and derived from the stare product."""
+    vert, hori = _winds_for_turbulence(stare, wind)
+    check_identical(
+        "from_winds",
+        turb,
+        Turbulence.from_winds(vert, hori, turbulence_options, dtype=dtype),
+    )
+    match stare.ray_info:
+        case PulsesPerRay(value):
+            ray_accumulation_time = value / 15e3
+        case RayAccumulationTime(value):
+            ray_accumulation_time = value
+    check_identical(
+        "from_winds (derived ray accumulation time)",
+        Turbulence.from_stare_and_wind(
+            stare,
+            wind,
+            dataclasses.replace(turbulence_options, ray_accumulation_time=None),
+            dtype=dtype,
+        ),
+        Turbulence.from_winds(
+            vert,
+            hori,
+            dataclasses.replace(
+                turbulence_options, ray_accumulation_time=ray_accumulation_time
+            ),
+            dtype=dtype,
+        ),
+    )
+
+
+def compare_turbulence_workers(
+    turb: Turbulence,
+    stare: product.Stare,
+    wind: Wind,
+    turbulence_options: TurbulenceOptions,
+    dtype: np.dtype,
+) -> None:
+    """Turbulence.from_stare_and_wind computing height blocks on four threads."""
+    threaded = Turbulence.from_stare_and_wind(
+        stare, wind, turbulence_options, dtype=dtype, workers=4
+    )
+    check_identical("workers", threaded, turb)
+
+
+TURBULENCE_COMPARISONS = {
+    "periods": compare_turbulence_periods,
+    "from_winds": compare_turbulence_from_winds,
+    "workers": compare_turbulence_workers,
+}
+
+
 # ── Product processors ───────────────────────────────────────────────
 
 
@@ -141,8 +484,24 @@ def lock_stare(case: dict) -> dict:
             data_bg=data_bg,
             bg_correction_method=options.BgCorrectionMethod.FIT,
             noise_mask_method=noise_mask_method,
+            dtype=dtype_option(case),
         )
+        for path in compare_option(case):
+            if path not in STARE_COMPARISONS:
+                raise ValueError(f"Unknown stare comparison: {path!r}")
+            STARE_COMPARISONS[path](
+                stare,
+                [
+                    (buf.getvalue(), r["filename"])
+                    for buf, r in zip(data_hpl, records_hpl)
+                ],
+                [(buf.getvalue(), filename) for buf, filename in data_bg],
+                noise_mask_method,
+                dtype_option(case),
+            )
     elif instrument_id in ("wls100s", "wls200s", "wls400s"):
+        if compare_option(case):
+            raise ValueError("compare is only supported for HALO stare cases")
         r_fixed = re.compile(r".*fixed.*", re.IGNORECASE)
         records_fixed = [rec for rec in records if r_fixed.match(rec["filename"])]
         group_pattern = re.compile(r".+_fixed_(.+)\.nc(?:\..+)?")
@@ -157,7 +516,9 @@ def lock_stare(case: dict) -> dict:
         # Use first group for stats
         stare = None
         for group, bufs in group_bufs.items():
-            stare = product.Stare.from_windcube_data(data=bufs)
+            stare = product.Stare.from_windcube_data(
+                data=bufs, dtype=dtype_option(case)
+            )
             break
         if stare is None:
             raise RuntimeError("No windcube fixed groups found")
@@ -199,19 +560,37 @@ def lock_wind(case: dict) -> dict:
             wind_options = product.wind.Options(
                 azimuth_offset_deg=opts["azimuth_offset_deg"]
             )
-        wind = Wind.from_halo_data(data=data_hpl, options=wind_options)
+        wind = Wind.from_halo_data(
+            data=data_hpl, options=wind_options, dtype=dtype_option(case)
+        )
+        for path in compare_option(case):
+            if path not in WIND_COMPARISONS:
+                raise ValueError(f"Unknown wind comparison: {path!r}")
+            WIND_COMPARISONS[path](
+                wind,
+                [
+                    (buf.getvalue(), r["filename"])
+                    for buf, r in zip(data_hpl, records_hpl)
+                ],
+                wind_options,
+                dtype_option(case),
+            )
 
     elif instrument_id == "wls70":
+        if compare_option(case):
+            raise ValueError("compare is only supported for HALO wind cases")
         records_wls70 = [rec for rec in records if rec["filename"].endswith(".rtd")]
         data = []
         for r in records_wls70:
             buf, entry = load_and_track(r)
             files.append(entry)
             data.append(buf)
-        wind = Wind.from_wls70_data(data=data)
+        wind = Wind.from_wls70_data(data=data, dtype=dtype_option(case))
 
     elif instrument_id in ("wls100s", "wls200s", "wls400s"):
         ftype = case.get("ftype")
+        if compare_option(case):
+            raise ValueError("compare is only supported for HALO wind cases")
         if ftype:
             ftype_re = re.compile(rf".*{ftype}_(.*)\.nc(?:\..*)?")
             matched = [rec for rec in records if ftype_re.match(rec["filename"])]
@@ -226,7 +605,7 @@ def lock_wind(case: dict) -> dict:
             buf, entry = load_and_track(rec)
             files.append(entry)
             data.append(buf)
-        wind = Wind.from_windcube_data(data)
+        wind = Wind.from_windcube_data(data, dtype=dtype_option(case))
 
     else:
         raise ValueError(f"Unsupported instrument for wind: {instrument_id!r}")
@@ -279,6 +658,7 @@ def lock_stare_depol(case: dict) -> dict:
         cross_data_bg=cross_data_bg,
         bg_correction_method=options.BgCorrectionMethod.FIT,
         polariser_bleed_through=0,
+        dtype=dtype_option(case),
     )
 
     expect = {
@@ -296,6 +676,7 @@ def lock_turbulence(case: dict) -> dict:
     files = []
     records = case["records"]
     instrument_id = case.get("instrument_id", "halo-doppler-lidar")
+    dtype = dtype_option(case)
 
     if instrument_id == "halo-doppler-lidar":
         records_hpl_stare = [
@@ -326,8 +707,9 @@ def lock_turbulence(case: dict) -> dict:
             data=stare_data,
             data_bg=bg_data,
             bg_correction_method=options.BgCorrectionMethod.FIT,
+            dtype=dtype,
         )
-        wind = Wind.from_halo_data(data=wind_data)
+        wind = Wind.from_halo_data(data=wind_data, dtype=dtype)
 
     elif instrument_id in ("wls100s", "wls200s", "wls400s"):
         inst_records = [r for r in records if r.get("instrument_id") == instrument_id]
@@ -351,7 +733,7 @@ def lock_turbulence(case: dict) -> dict:
                 group_files.append(entry)
                 stare_data.append(buf)
             try:
-                stare = product.Stare.from_windcube_data(data=stare_data)
+                stare = product.Stare.from_windcube_data(data=stare_data, dtype=dtype)
                 files.extend(group_files)
                 break
             except (ValueError, doppy.exceptions.NoDataError):
@@ -369,25 +751,17 @@ def lock_turbulence(case: dict) -> dict:
             buf, entry = load_and_track(r)
             files.append(entry)
             wind_data.append(buf)
-        wind = Wind.from_windcube_data(wind_data)
+        wind = Wind.from_windcube_data(wind_data, dtype=dtype)
 
     else:
         raise ValueError(f"Unsupported instrument for turbulence: {instrument_id!r}")
 
-    turb = Turbulence.from_winds(
-        VerticalWind(
-            time=stare.time,
-            height=stare.radial_distance,
-            w=stare.radial_velocity,
-            mask=stare.mask_radial_velocity,
-        ),
-        HorizontalWind(
-            time=wind.time,
-            height=wind.height,
-            V=np.sqrt(wind.zonal_wind**2 + wind.meridional_wind**2),
-        ),
-        TurbulenceOptions(ray_accumulation_time=1),
-    )
+    turbulence_options = TurbulenceOptions(ray_accumulation_time=1)
+    turb = Turbulence.from_stare_and_wind(stare, wind, turbulence_options, dtype=dtype)
+    for path in compare_option(case):
+        if path not in TURBULENCE_COMPARISONS:
+            raise ValueError(f"Unknown turbulence comparison: {path!r}")
+        TURBULENCE_COMPARISONS[path](turb, stare, wind, turbulence_options, dtype)
 
     expect = {
         "time_len": len(turb.time),
@@ -1,6 +1,7 @@
 import argparse
 import pathlib
 import re
+import subprocess
 import sys
 import tempfile
 import time
@@ -491,6 +492,20 @@ def handle_product_turbulence(api: Api, case: dict):
     )
 
 
+# ── Package Handlers ─────────────────────────────────────────────────
+
+
+def handle_package_attribute(_api: Api, case: dict):
+    """Attribute of a package with lazy exports, accessed after importing
+    only the package. Runs in a fresh interpreter, where the submodules have
+    not been imported yet."""
+    statement = f"import {case['package']}; {case['package']}.{case['attribute']}"
+    res = subprocess.run(
+        [sys.executable, "-c", statement], capture_output=True, text=True
+    )
+    assert res.returncode == 0, f"{statement!r} failed:\n{res.stderr}"
+
+
 # ── Handler dispatch ─────────────────────────────────────────────────
 
 HANDLERS: dict[str, object] = {
@@ -504,6 +519,7 @@ HANDLERS: dict[str, object] = {
     "raw.halo_sys_params_all": handle_raw_halo_sys_params_all,
     "raw.windcube": handle_raw_windcube,
     "raw.windcube_bad": handle_raw_windcube_bad,
+    "raw.package_attribute": handle_package_attribute,
     "product.stare": handle_product_stare,
     "product.stare_bad": handle_product_stare_bad,
     "product.stare_system_id": handle_product_stare_system_id,
@@ -518,6 +534,7 @@ HANDLERS: dict[str, object] = {
     "product.stare_depol": handle_product_stare_depol,
     "product.stare_depol_bad": handle_product_stare_depol_bad,
     "product.turbulence": handle_product_turbulence,
+    "product.package_attribute": handle_package_attribute,
 }
 
 
@@ -536,6 +553,8 @@ def format_test_name(table_name: str, case: dict) -> str:
         parts.append(case["source"])
     if "ftype" in case:
         parts.append(case["ftype"])
+    if "attribute" in case:
+        parts.append(f"{case['package']}.{case['attribute']}")
     name = "::".join(parts)
     if "id" in case:
         return f"[{case['id']}] {name}"
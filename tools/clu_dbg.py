@@ -2,14 +2,13 @@ import argparse
 from pathlib import Path
 from pprint import pprint
 
-import numpy as np
 from dataset import Dataset, Record
 
 import doppy
 from doppy.exceptions import RawParsingError
 from doppy.options import BgCorrectionMethod
 from doppy.product import Stare, StareDepol
-from doppy.product.turbulence import HorizontalWind, Options, Turbulence, VerticalWind
+from doppy.product.turbulence import Options, Turbulence
 from doppy.product.wind import Wind
 
 
@@ -85,19 +84,8 @@ def _process_turbulence(args):
     wind = Wind.from_halo_data(
         data=data_hpl_wind,
     )
-    _turb = Turbulence.from_winds(
-        VerticalWind(
-            time=stare.time,
-            height=stare.radial_distance,
-            w=stare.radial_velocity,
-            mask=stare.mask_radial_velocity,
-        ),
-        HorizontalWind(
-            time=wind.time,
-            height=wind.height,
-            V=np.sqrt(wind.zonal_wind**2 + wind.meridional_wind**2),
-        ),
-        Options(ray_accumulation_time=1),
+    _turb = Turbulence.from_stare_and_wind(
+        stare, wind, Options(ray_accumulation_time=1)
     )
 
 
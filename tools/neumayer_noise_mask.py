@@ -43,17 +43,15 @@ def main() -> None:
         ):
             paths.append(path)
 
-    default = doppy.product.Stare.from_halo_data(
+    pipeline = doppy.product.StarePipeline(
         data=paths,
         data_bg=paths_bg,
         bg_correction_method=BgCorrectionMethod.FIT,
     )
-    intensity_only = doppy.product.Stare.from_halo_data(
-        data=paths,
-        data_bg=paths_bg,
-        bg_correction_method=BgCorrectionMethod.FIT,
-        noise_mask_method=NoiseMaskMethod.INTENSITY_ONLY,
-    )
+    default = pipeline.stare
+    # Only the masks are recomputed
+    pipeline.noise_mask_method = NoiseMaskMethod.INTENSITY_ONLY
+    intensity_only = pipeline.stare
 
     _print_stats("default", default)
     _print_stats("intensity_only", intensity_only)